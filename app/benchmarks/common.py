@@ -0,0 +1,152 @@
+"""Utilidades compartidas por los benchmarks: encoder stub, base de prueba y medición."""
+import json
+import platform
+import statistics
+import subprocess
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.database import DATABASE_URL
+from app.models.job import Job  # noqa: F401 (registra la tabla jobs en Base)
+from app.models.review import Base
+
+EMBEDDING_DIM = 384
+
+
+class StubEncoder:
+    """Encoder determinístico que imita la interfaz de SentenceTransformer.
+
+    Cada token tiene un vector aleatorio fijo (semilla = crc32 del token) y el
+    embedding del texto es la suma normalizada. Textos con palabras en común
+    quedan cerca, así que las búsquedas devuelven resultados con sentido sin
+    cargar torch ni el modelo real.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self._token_vectors: Dict[str, np.ndarray] = {}
+
+    def _token_vector(self, token: str) -> np.ndarray:
+        vec = self._token_vectors.get(token)
+        if vec is None:
+            rng = np.random.default_rng(zlib.crc32(token.encode("utf-8")))
+            vec = rng.standard_normal(self.dim).astype(np.float32)
+            self._token_vectors[token] = vec
+        return vec
+
+    def _encode_one(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for token in (text or "").lower().split():
+            vec += self._token_vector(token.strip(".,;:!?"))
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, device: Optional[str] = None, **kwargs):
+        if isinstance(sentences, str):
+            return self._encode_one(sentences)
+        return np.stack([self._encode_one(s) for s in sentences]) if sentences else np.zeros((0, self.dim), dtype=np.float32)
+
+
+def make_session_factory(database_url: str):
+    """Crea engine + sessionmaker para la base de benchmark.
+
+    Para SQLite desactiva el chequeo de thread, porque TestClient atiende los
+    requests en otro hilo.
+    """
+    if database_url == DATABASE_URL:
+        raise ValueError("La base de benchmark no puede ser la base de la aplicación (se borran las tablas)")
+    connect_args = {"check_same_thread": False} if database_url.startswith("sqlite") else {}
+    engine = create_engine(database_url, connect_args=connect_args)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def reset_schema(engine) -> None:
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+
+def measure(fn: Callable[[], Any], repeat: int = 5, warmup: int = 1) -> Dict[str, Any]:
+    """Ejecuta `fn` varias veces y devuelve estadísticas de tiempo en milisegundos."""
+    for _ in range(warmup):
+        fn()
+    samples: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    samples.sort()
+    p95_idx = min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))
+    return {
+        "repeat": repeat,
+        "min_ms": samples[0],
+        "median_ms": statistics.median(samples),
+        "mean_ms": statistics.fmean(samples),
+        "p95_ms": samples[p95_idx],
+        "max_ms": samples[-1],
+    }
+
+
+def measure_once(fn: Callable[[], Any]) -> Dict[str, Any]:
+    """Para pasos que modifican la base (embeddings, tópicos) y no se pueden repetir."""
+    return measure(fn, repeat=1, warmup=0)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except Exception:
+        return None
+
+
+def run_metadata(**extra) -> Dict[str, Any]:
+    meta = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+    meta.update(extra)
+    return meta
+
+
+def write_results(path: Optional[str], results: Dict[str, Any]) -> None:
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[Bench] Resultados guardados en {path}")
+    else:
+        print(text)
+
+
+def compare_results(old_path: str, new_path: str, metric: str = "median_ms") -> List[Dict[str, Any]]:
+    """Compara dos archivos de resultados y devuelve el ratio nuevo/viejo por benchmark."""
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+
+    rows = []
+    for scale, benches in new.get("scales", {}).items():
+        old_benches = old.get("scales", {}).get(scale, {})
+        for name, stats in benches.items():
+            if not isinstance(stats, dict) or metric not in stats:
+                continue
+            before = old_benches.get(name, {}).get(metric)
+            after = stats[metric]
+            rows.append({
+                "scale": scale,
+                "benchmark": name,
+                "before": before,
+                "after": after,
+                "ratio": (after / before) if before else None,
+            })
+    return rows
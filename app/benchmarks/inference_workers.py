@@ -0,0 +1,142 @@
+"""Benchmark de RSS y throughput: modelo por worker vs servidor de inferencia compartido.
+
+Simula K workers web (procesos) que codifican consultas cortas en paralelo y
+compara dos modos:
+
+    local   cada worker carga su propio encoder (lo que pasa hoy con --workers K)
+    shared  un único servidor de inferencia y los workers usan RemoteEncoder
+
+Reporta RSS total (workers + servidor) y textos/segundo para cada K:
+
+    python -m app.benchmarks.inference_workers --workers 1 4 8 --encoder model --output infer.json
+"""
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from app.benchmarks.common import run_metadata, write_results
+from app.services.create_samples import generate_reviews
+
+REQUESTS_PER_WORKER = 200
+TEXTS_PER_REQUEST = 1
+
+
+def rss_bytes(pid: int) -> int:
+    """RSS actual de un proceso leyendo /proc (Linux)."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _make_encoder(mode: str, encoder: str, socket_path: str):
+    if mode == "shared":
+        from app.services.inference_server import RemoteEncoder
+        return RemoteEncoder(socket_path)
+    if encoder == "stub":
+        from app.benchmarks.common import StubEncoder
+        return StubEncoder()
+    from app.services.topic_model import load_local_model
+    return load_local_model()
+
+
+def _worker(mode: str, encoder: str, socket_path: str, texts: List[str], per_request: int,
+            ready, start, out):
+    model = _make_encoder(mode, encoder, socket_path)
+    model.encode(texts[:per_request])
+    ready.wait()
+    start.wait()
+    t0 = time.perf_counter()
+    for i in range(0, len(texts), per_request):
+        model.encode(texts[i:i + per_request])
+    elapsed = time.perf_counter() - t0
+    out.put({"pid": os.getpid(), "texts": len(texts), "seconds": elapsed, "rss": rss_bytes(os.getpid())})
+
+
+def _start_server(encoder: str, socket_path: str, ctx):
+    from app.services.inference_server import serve
+    proc = ctx.Process(target=serve, args=(socket_path,), kwargs={"encoder": encoder}, daemon=True)
+    proc.start()
+    deadline = time.monotonic() + 120
+    while not os.path.exists(socket_path):
+        if time.monotonic() > deadline or not proc.is_alive():
+            raise RuntimeError("El servidor de inferencia no arrancó")
+        time.sleep(0.05)
+    return proc
+
+
+def run_case(mode: str, n_workers: int, encoder: str, requests_per_worker: int, per_request: int) -> Dict[str, Any]:
+    ctx = mp.get_context("spawn")
+    texts = [r["text"] for r in generate_reviews(n_workers * requests_per_worker * per_request, seed=7)]
+    socket_path = os.path.join(tempfile.mkdtemp(prefix="bares_enc_"), "encoder.sock")
+
+    server = _start_server(encoder, socket_path, ctx) if mode == "shared" else None
+    try:
+        ready = ctx.Barrier(n_workers + 1)
+        start = ctx.Event()
+        out = ctx.Queue()
+        chunk = requests_per_worker * per_request
+        procs = [
+            ctx.Process(target=_worker, args=(mode, encoder, socket_path, texts[i * chunk:(i + 1) * chunk],
+                                              per_request, ready, start, out))
+            for i in range(n_workers)
+        ]
+        for p in procs:
+            p.start()
+        ready.wait()
+        server_rss = rss_bytes(server.pid) if server else 0
+        t0 = time.perf_counter()
+        start.set()
+        reports = [out.get() for _ in procs]
+        wall = time.perf_counter() - t0
+        for p in procs:
+            p.join()
+        server_rss = max(server_rss, rss_bytes(server.pid) if server else 0)
+    finally:
+        if server:
+            server.terminate()
+            server.join()
+
+    workers_rss = sum(r["rss"] for r in reports)
+    total_texts = sum(r["texts"] for r in reports)
+    return {
+        "mode": mode,
+        "workers": n_workers,
+        "texts": total_texts,
+        "wall_seconds": wall,
+        "texts_per_second": total_texts / wall if wall else None,
+        "workers_rss_mb": workers_rss / 2**20,
+        "server_rss_mb": server_rss / 2**20,
+        "total_rss_mb": (workers_rss + server_rss) / 2**20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RSS y throughput con encoder por worker vs compartido")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 4, 8])
+    parser.add_argument("--modes", nargs="+", choices=["local", "shared"], default=["local", "shared"])
+    parser.add_argument("--encoder", choices=["stub", "model"], default="stub")
+    parser.add_argument("--requests", type=int, default=REQUESTS_PER_WORKER, help="Pedidos por worker")
+    parser.add_argument("--texts-per-request", type=int, default=TEXTS_PER_REQUEST)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = {"meta": run_metadata(encoder=args.encoder, requests=args.requests,
+                                    texts_per_request=args.texts_per_request), "cases": []}
+    for n in args.workers:
+        for mode in args.modes:
+            case = run_case(mode, n, args.encoder, args.requests, args.texts_per_request)
+            print(f"[Bench] {mode:>6} x{n}: {case['texts_per_second']:.0f} textos/s, RSS total {case['total_rss_mb']:.0f} MB")
+            results["cases"].append(case)
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Benchmark de tamaño de respuesta y tiempo de serialización por endpoint.
+
+Compara, sobre datos sintéticos, la respuesta original (lista de dicts con el
+texto completo, encoder JSON estándar, sin compresión) contra proyección
+(`fields=` + `text_chars=`), formato columnar, orjson y gzip/brotli:
+
+    python -m app.benchmarks.payloads --scale 10k --output payloads.json
+"""
+import argparse
+import json
+import os
+from typing import Any, Dict
+
+from fastapi.encoders import jsonable_encoder
+
+from app.benchmarks.common import StubEncoder, make_session_factory, measure, reset_schema, run_metadata, write_results
+from app.benchmarks.suite import DEFAULT_DATABASE_URL, _api_client
+from app.models.review import Review
+from app.services import topic_model
+from app.services.create_samples import parse_scale, save_samples
+from app.services.responses import brotli, dumps, shape_rows
+
+TEXT_CHARS = 100
+
+# (nombre, método, path, body/params base, campos compactos)
+ENDPOINTS = [
+    ("POST /topic_model/search", "post", "/topic_model/search", {"query": "cerveza artesanal buena onda"},
+     "place_id,name,lat,lon,rating,similarity_score"),
+    ("GET /topic_model/similar/{id}", "get", "/topic_model/similar/{id}", {},
+     "place_id,name,lat,lon,rating,similarity_score"),
+    ("GET /maps/", "get", "/maps/", {}, "name,rating,lat,lon"),
+    ("GET /reviews/reviews_json", "get", "/reviews/reviews_json", {}, "id,name,lat,lon,rating,topic"),
+]
+
+
+def _stdlib_dumps(content: Any) -> bytes:
+    """Lo que hacía FastAPI por defecto: jsonable_encoder + json.dumps."""
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def _call(client, method: str, path: str, base: Dict[str, Any], extra: Dict[str, Any], encoding: str):
+    headers = {"Accept-Encoding": encoding}
+    if method == "post":
+        return client.post(path, json={**base, **extra}, headers=headers)
+    return client.get(path, params={**base, **extra}, headers=headers)
+
+
+def _wire_bytes(resp) -> int:
+    return int(resp.headers.get("content-length", len(resp.content)))
+
+
+def bench_endpoint(client, method: str, path: str, base: Dict[str, Any], fields: str, repeat: int) -> Dict[str, Any]:
+    variants = {
+        "baseline": {},
+        "projected": {"fields": fields, "text_chars": TEXT_CHARS},
+        "columns": {"fields": fields, "text_chars": TEXT_CHARS, "format": "columns"},
+    }
+    encodings = {"identity": "identity", "gzip": "gzip"}
+    if brotli is not None:
+        encodings["br"] = "br"
+
+    result: Dict[str, Any] = {"bytes": {}, "serialize_ms": {}}
+    for name, extra in variants.items():
+        for enc_name, enc in encodings.items():
+            resp = _call(client, method, path, base, extra, enc)
+            resp.raise_for_status()
+            result["bytes"][f"{name}/{enc_name}"] = _wire_bytes(resp)
+
+    # Tiempos de serialización del mismo contenido, fuera del stack HTTP
+    content = _call(client, method, path, base, {}, "identity").json()
+    rows = content if isinstance(content, list) else None
+    result["serialize_ms"]["stdlib_full"] = measure(lambda: _stdlib_dumps(content), repeat=repeat)["median_ms"]
+    result["serialize_ms"]["orjson_full"] = measure(lambda: dumps(content), repeat=repeat)["median_ms"]
+    if rows is not None:
+        result["serialize_ms"]["orjson_projected"] = measure(
+            lambda: dumps(shape_rows(rows, fields=fields, text_chars=TEXT_CHARS)), repeat=repeat)["median_ms"]
+        result["serialize_ms"]["orjson_columns"] = measure(
+            lambda: dumps(shape_rows(rows, fields=fields, text_chars=TEXT_CHARS, fmt="columns")), repeat=repeat)["median_ms"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tamaño de payload y tiempo de serialización por endpoint")
+    parser.add_argument("--scale", default="1k")
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    n = parse_scale(args.scale)
+    topic_model.set_model(StubEncoder())
+    os.makedirs("data", exist_ok=True)
+    engine, SessionLocal = make_session_factory(args.database_url.format(scale=args.scale))
+    reset_schema(engine)
+    db = SessionLocal()
+    try:
+        save_samples(db, n)
+        topic_model.run_topic_modeling(db)
+        review_id = db.query(Review.id).filter(Review.embedding.isnot(None)).first()[0]
+    finally:
+        db.close()
+
+    client = _api_client(SessionLocal)
+    results = {"meta": run_metadata(n_reviews=n, text_chars=TEXT_CHARS), "endpoints": {}}
+    for name, method, path, base, fields in ENDPOINTS:
+        res = bench_endpoint(client, method, path.format(id=review_id), base, fields, args.repeat)
+        results["endpoints"][name] = res
+        b = res["bytes"]
+        print(f"[Bench] {name}: {b['baseline/identity']} B -> {b['columns/identity']} B columnar"
+              f" -> {b.get('columns/br', b['columns/gzip'])} B comprimido; "
+              f"serialización {res['serialize_ms']['stdlib_full']:.2f} ms -> {res['serialize_ms']['orjson_full']:.2f} ms (orjson)")
+    engine.dispose()
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Benchmark de cuantización: memoria, recall@10 y latencia contra la búsqueda float.
+
+Por defecto usa vectores sintéticos agrupados (mezcla de gaussianas
+normalizadas, 384 dims); con --snapshot usa los embeddings reales de un
+snapshot exportado con `make snapshot`.
+
+    python -m app.benchmarks.quantization --n 200000 --subvectors 24 48 96 --output quant.json
+    python -m app.benchmarks.quantization --snapshot data/snapshots/current
+"""
+import argparse
+import os
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.benchmarks.common import EMBEDDING_DIM, run_metadata, write_results
+from app.services.quantization import RERANK_SHORTLIST, ProductQuantizer, ScalarQuantizer, shortlist_rerank
+
+K = 10
+N_QUERIES = 200
+
+
+def synthetic_vectors(n: int, dim: int = EMBEDDING_DIM, n_clusters: int = 200, seed: int = 42) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    vectors = centers[labels] + 0.9 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def make_queries(vectors: np.ndarray, n_queries: int, seed: int = 7) -> np.ndarray:
+    """Consultas cercanas a vectores del corpus (como buscar algo parecido a una reseña)."""
+    rng = np.random.default_rng(seed)
+    base = np.asarray(vectors[rng.choice(len(vectors), size=n_queries, replace=False)], dtype=np.float32)
+    queries = base + 0.3 * rng.standard_normal(base.shape).astype(np.float32) / np.sqrt(base.shape[1])
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def _top_k(scores: np.ndarray, rows: np.ndarray, k: int = K) -> np.ndarray:
+    idx = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+    return rows[idx]
+
+
+def _latency(samples: List[float]) -> Dict[str, float]:
+    arr = np.array(samples) * 1000.0
+    return {"median_ms": float(np.median(arr)), "p95_ms": float(np.percentile(arr, 95))}
+
+
+def evaluate(quantizer, vectors: np.ndarray, queries: np.ndarray, truth: List[np.ndarray],
+             shortlist: int) -> Dict[str, Any]:
+    n, dim = vectors.shape
+    rows = np.arange(n)
+
+    t0 = time.perf_counter()
+    quantizer.fit(vectors)
+    train_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    codes = quantizer.encode(vectors)
+    encode_s = time.perf_counter() - t0
+
+    approx_hits, rerank_hits = 0, 0
+    approx_times, rerank_times = [], []
+    for q, expected in zip(queries, truth):
+        expected = set(expected.tolist())
+
+        t0 = time.perf_counter()
+        approx = quantizer.score(codes, q)
+        top = _top_k(approx, rows)
+        approx_times.append(time.perf_counter() - t0)
+        approx_hits += len(expected & set(top.tolist()))
+
+        t0 = time.perf_counter()
+        cand_rows, exact = shortlist_rerank(quantizer, codes, vectors, rows, q, shortlist)
+        top = _top_k(exact, cand_rows)
+        rerank_times.append(time.perf_counter() - t0)
+        rerank_hits += len(expected & set(top.tolist()))
+
+    code_bytes = quantizer.bytes_per_vector()
+    model_bytes = sum(a.nbytes for a in quantizer.to_arrays().values())
+    return {
+        "kind": quantizer.kind,
+        "subvectors": getattr(quantizer, "n_subvectors", None),
+        "bytes_per_vector": code_bytes,
+        "mb_per_million_vectors": (code_bytes * 1_000_000 + model_bytes) / 2**20,
+        "compression": (dim * 4) / code_bytes,
+        "train_seconds": train_s,
+        "encode_seconds": encode_s,
+        f"recall@{K}_approx": approx_hits / (K * len(queries)),
+        f"recall@{K}_rerank": rerank_hits / (K * len(queries)),
+        "shortlist": shortlist,
+        "approx_latency": _latency(approx_times),
+        "rerank_latency": _latency(rerank_times),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PQ / int8 vs búsqueda float exacta")
+    parser.add_argument("--n", type=int, default=100_000, help="Vectores sintéticos (sin --snapshot)")
+    parser.add_argument("--snapshot", default=None, help="Directorio de snapshot con embeddings.npy")
+    parser.add_argument("--subvectors", nargs="+", type=int, default=[24, 48, 96])
+    parser.add_argument("--no-int8", action="store_true")
+    parser.add_argument("--queries", type=int, default=N_QUERIES)
+    parser.add_argument("--shortlist", type=int, default=RERANK_SHORTLIST)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    if args.snapshot:
+        vectors = np.load(os.path.join(args.snapshot, "embeddings.npy"), mmap_mode="r")
+        has = np.load(os.path.join(args.snapshot, "has_embedding.npy"))
+        vectors = np.ascontiguousarray(vectors[has])
+    else:
+        vectors = synthetic_vectors(args.n)
+    n, dim = vectors.shape
+    queries = make_queries(vectors, min(args.queries, n))
+    rows = np.arange(n)
+
+    truth, float_times = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        scores = vectors @ q
+        truth.append(_top_k(scores, rows))
+        float_times.append(time.perf_counter() - t0)
+
+    results = {
+        "meta": run_metadata(n_vectors=n, dim=dim, queries=len(queries),
+                             source=args.snapshot or "synthetic"),
+        "float32": {
+            "bytes_per_vector": dim * 4,
+            "mb_per_million_vectors": dim * 4 * 1_000_000 / 2**20,
+            f"recall@{K}": 1.0,
+            "latency": _latency(float_times),
+        },
+        "quantized": [],
+    }
+    print(f"[Bench] float32: {results['float32']['latency']['median_ms']:.2f} ms/consulta, "
+          f"{results['float32']['mb_per_million_vectors']:.0f} MB por millón")
+
+    quantizers = [ProductQuantizer(n_subvectors=m) for m in args.subvectors if dim % m == 0]
+    if not args.no_int8:
+        quantizers.append(ScalarQuantizer())
+    for quantizer in quantizers:
+        res = evaluate(quantizer, vectors, queries, truth, args.shortlist)
+        print(f"[Bench] {res['kind']}{'/' + str(res['subvectors']) if res['subvectors'] else ''}: "
+              f"{res['mb_per_million_vectors']:.0f} MB por millón, "
+              f"recall@{K} {res[f'recall@{K}_approx']:.3f} -> {res[f'recall@{K}_rerank']:.3f} con re-rank, "
+              f"{res['rerank_latency']['median_ms']:.2f} ms/consulta")
+        results["quantized"].append(res)
+
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
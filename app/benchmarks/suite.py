@@ -0,0 +1,156 @@
+"""Suite de benchmarks end-to-end sobre datos sintéticos.
+
+Genera N reseñas, las carga en una base de prueba (SQLite por defecto, o un
+Postgres local vía --database-url) y mide los pasos principales del pipeline
+y de la API. El resultado es un JSON comparable entre commits:
+
+    python -m app.benchmarks.suite --scale 1k 10k --output bench_before.json
+    python -m app.benchmarks.suite --compare bench_before.json bench_after.json
+"""
+import argparse
+import os
+import random
+from typing import Any, Dict, List
+
+from app.benchmarks.common import (
+    StubEncoder, compare_results, make_session_factory, measure, measure_once,
+    reset_schema, run_metadata, write_results,
+)
+from app.models.review import Review
+from app.services import topic_model
+from app.services.create_samples import NEIGHBORHOODS, parse_scale, save_samples
+from app.services.geo_search import find_nearby
+
+BENCHMARKS = [
+    "precompute_embeddings",
+    "run_topic_modeling",
+    "find_similar_to_query",
+    "get_similar_reviews",
+    "find_nearby",
+    "GET /maps/",
+    "GET /reviews/reviews_json",
+]
+
+QUERIES = [
+    "cerveza artesanal buena onda",
+    "great steak and wine",
+    "pizza rapida",
+    "quiet place for a date",
+    "",
+]
+
+DEFAULT_DATABASE_URL = "sqlite:///data/bench_{scale}.db"
+
+
+def _api_client(SessionLocal):
+    """TestClient de la app con `get_db` apuntando a la base de benchmark."""
+    from fastapi.testclient import TestClient
+    from app.db.database import get_db
+    from app.main import app
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+def run_scale(n: int, database_url: str, selected: List[str], repeat: int, seed: int) -> Dict[str, Any]:
+    engine, SessionLocal = make_session_factory(database_url)
+    reset_schema(engine)
+
+    results: Dict[str, Any] = {"n_reviews": n, "database": engine.dialect.name}
+    db = SessionLocal()
+    try:
+        print(f"[Bench] Insertando {n} reseñas sintéticas...")
+        results["seed_samples"] = measure_once(lambda: save_samples(db, n, seed=seed))
+
+        # Embeddings y tópicos son prerequisito del resto, se corren siempre
+        results["precompute_embeddings"] = measure_once(lambda: topic_model.precompute_embeddings(db))
+        results["run_topic_modeling"] = measure_once(lambda: topic_model.run_topic_modeling(db))
+
+        rng = random.Random(seed)
+        ids = [row[0] for row in db.query(Review.id).filter(Review.embedding.isnot(None)).all()]
+
+        if "find_similar_to_query" in selected:
+            queries = iter(QUERIES * (repeat + 1))
+            results["find_similar_to_query"] = measure(
+                lambda: topic_model.find_similar_to_query(db, next(queries)), repeat=repeat
+            )
+
+        if "get_similar_reviews" in selected and ids:
+            results["get_similar_reviews"] = measure(
+                lambda: topic_model.get_similar_reviews(db, rng.choice(ids)), repeat=repeat
+            )
+
+        if "find_nearby" in selected:
+            queries = iter(QUERIES * (repeat + 1))
+            centers = [(lat, lon) for _, lat, lon, _ in NEIGHBORHOODS]
+            results["find_nearby"] = measure(
+                lambda: find_nearby(db, *rng.choice(centers), radius_km=1.0, query=next(queries)), repeat=repeat
+            )
+    finally:
+        db.close()
+
+    api_benches = [b for b in selected if b.startswith("GET ")]
+    if api_benches:
+        client = _api_client(SessionLocal)
+        for name in api_benches:
+            path = name.split(" ", 1)[1]
+            sizes = []
+
+            def call():
+                resp = client.get(path)
+                resp.raise_for_status()
+                sizes.append(len(resp.content))
+
+            results[name] = measure(call, repeat=repeat)
+            results[name]["response_bytes"] = sizes[-1]
+
+    engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks end-to-end con datos sintéticos")
+    parser.add_argument("--scale", nargs="+", default=["1k"], help="Escalas a correr (1k, 10k, 100k, 1m o un número)")
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL,
+                        help="URL de la base de prueba; '{scale}' se reemplaza por la escala. Se borran sus tablas.")
+    parser.add_argument("--encoder", choices=["stub", "model"], default="stub",
+                        help="'stub' usa un encoder determinístico sin torch; 'model' usa SentenceTransformer")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Archivo JSON de salida (por defecto stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Comparar dos archivos de resultados")
+    args = parser.parse_args()
+
+    if args.compare:
+        for row in compare_results(*args.compare):
+            ratio = f"{row['ratio']:.2f}x" if row["ratio"] else "n/a"
+            print(f"{row['scale']:>6}  {row['benchmark']:<28} {row['before'] or 0:>10.1f} -> {row['after']:>10.1f} ms  ({ratio})")
+        return
+
+    if args.encoder == "stub":
+        topic_model.set_model(StubEncoder())
+
+    os.makedirs("data", exist_ok=True)
+    results = {
+        "meta": run_metadata(encoder=args.encoder, repeat=args.repeat, seed=args.seed),
+        "scales": {},
+    }
+    for scale in args.scale:
+        n = parse_scale(scale)
+        url = args.database_url.format(scale=scale)
+        print(f"[Bench] Escala {scale} ({n} reseñas) en {url}")
+        results["scales"][scale] = run_scale(n, url, args.only, args.repeat, args.seed)
+
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
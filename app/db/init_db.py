@@ -1,4 +1,5 @@
 from app.models.review import Base
+from app.models.job import Job  # noqa: F401 (registra la tabla jobs en Base)
 from app.db.database import engine
 from app.services.topic_model import precompute_embeddings, run_topic_modeling
 from app.db.database import get_db
@@ -1,7 +1,14 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import reviews, maps, topic_model
+from app.routes import reviews, maps, topic_model, metrics, jobs
+from app.services.metrics import inc, observe, start_request_profile
+from app.services.responses import CompressionMiddleware, COMPRESSION_MIN_SIZE
+from app.services.jobs import job_queue
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ON = {"1", "true", "yes", "on"}
 
 app = FastAPI(title="Bares BA MVP")
 
@@ -14,10 +21,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Comprimir respuestas (brotli si está instalado, si no gzip) a partir de COMPRESSION_MIN_SIZE bytes
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# Métricas por request; con el header X-Profile: 1 (o true) se devuelve el desglose de spans en Server-Timing
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    profile = request.headers.get(PROFILE_HEADER, "").strip().lower() in PROFILE_ON
+    spans = start_request_profile() if profile else None
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    route = request.scope.get("route")
+    path = getattr(route, "path", None) or "static"
+    inc("http_requests_total", method=request.method, path=path, status=response.status_code)
+    observe("http_request_duration_seconds", elapsed, method=request.method, path=path)
+
+    if spans is not None:
+        timings = [f"{name};dur={duration * 1000:.2f}" for name, duration in spans]
+        timings.append(f"total;dur={elapsed * 1000:.2f}")
+        response.headers["Server-Timing"] = ", ".join(timings)
+    return response
+
+# Cola de jobs en segundo plano (refresco incremental y topic modeling)
+@app.on_event("startup")
+def start_job_queue():
+    job_queue.start()
+
+@app.on_event("shutdown")
+def stop_job_queue():
+    job_queue.shutdown(wait=True, timeout=5)
+
 # Incluir routers
 app.include_router(reviews.router, prefix="/reviews")
 app.include_router(maps.router, prefix="/maps")
 app.include_router(topic_model.router, prefix="/topic_model")
+app.include_router(jobs.router, prefix="/jobs")
+app.include_router(metrics.router)
 
 # Servir archivos estáticos
-app.mount("/", StaticFiles(directory="app/static", html=True), name="static")
\ No newline at end of file
+app.mount("/", StaticFiles(directory="app/static", html=True), name="static")
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
+
+from app.models.review import Base
+
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="queued")
+    payload = Column(Text)
+    stage = Column(String)
+    processed = Column(Integer, default=0)
+    total = Column(Integer, default=0)
+    result = Column(Text)
+    error = Column(Text)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime)
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('idx_jobs_status', 'status'),
+    )
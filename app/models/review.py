@@ -25,4 +25,6 @@ class Review(Base):
         Index('idx_reviews_neighborhood', 'name'),
         Index('idx_reviews_rating', 'rating'),
         Index('idx_reviews_topic', 'topic'),
+        Index('idx_reviews_place_id', 'place_id'),
+        Index('idx_reviews_h3_index', 'h3_index'),
     )
@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.db.database import get_db
+from app.models.job import Job
+from app.services.jobs import enqueue_refresh, job_queue, job_to_dict, requeue_job
+from typing import List, Optional
+from pydantic import BaseModel
+
+router = APIRouter()
+
+class RefreshRequest(BaseModel):
+    review_ids: Optional[List[int]] = None
+
+@router.get("/")
+def list_jobs(
+    db: Session = Depends(get_db),
+    status: Optional[str] = Query(None, description="queued, running, done o failed"),
+    kind: Optional[str] = Query(None, description="refresh_reviews o topic_modeling"),
+    limit: int = Query(20, ge=1, le=200)
+):
+    """Jobs más recientes primero"""
+    query = db.query(Job)
+    if status:
+        query = query.filter(Job.status == status)
+    if kind:
+        query = query.filter(Job.kind == kind)
+    return [job_to_dict(job) for job in query.order_by(Job.id.desc()).limit(limit)]
+
+@router.get("/{job_id}")
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    """Estado y progreso de un job"""
+    job = db.get(Job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return job_to_dict(job)
+
+@router.post("/refresh", status_code=202)
+def refresh_reviews(request: RefreshRequest, db: Session = Depends(get_db)):
+    """
+    Encola embeddings + tópico + H3 para esas reseñas (o para todas las incompletas si no se pasan ids)
+    """
+    job = enqueue_refresh(db, request.review_ids)
+    return job_to_dict(job)
+
+@router.post("/{job_id}/retry", status_code=202)
+def retry_job(job_id: int, db: Session = Depends(get_db)):
+    """Vuelve a encolar un job fallido, o uno que quedó corriendo sin heartbeat (su proceso murió)"""
+    job = db.get(Job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    if not requeue_job(db, job_id):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Solo se reintentan jobs fallidos o sin heartbeat (estado: {job.status})"
+        )
+    job_queue.submit(job_id)
+    db.refresh(job)
+    return job_to_dict(job)
@@ -1,31 +1,78 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
 from app.db.database import get_db
 from app.models.review import Review
 from collections import defaultdict
+from app.services.metrics import span
+from app.services.snapshot import get_snapshot
+from app.services.map_visualization import get_clustered_map_html, place_details
+from app.services.responses import FORMAT_PATTERN, FastJSONResponse, parse_fields, project_rows, to_columns
+from typing import Optional
 
 router = APIRouter()
 
 @router.get("/")
 def get_reviews_map(
     db: Session = Depends(get_db),
-    topic_filter: str = Query(None, description="Filtrar por topic")
+    topic_filter: str = Query(None, description="Filtrar por topic"),
+    fields: Optional[str] = Query(None, description="Campos a devolver, separados por coma"),
+    text_chars: Optional[int] = Query(None, ge=0, description="Truncar el texto a N caracteres"),
+    format: str = Query("rows", pattern=FORMAT_PATTERN, description="rows (agrupado por celda H3) o columns (arrays paralelos con h3_index)")
 ):
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        map_data = snapshot.map_data(topic_filter)
+    else:
+        map_data = _map_data_from_db(db, topic_filter)
+
+    with span("maps.serialize"):
+        field_list = parse_fields(fields)
+        if format == "columns":
+            rows = [dict(row, h3_index=cell) for cell, cell_rows in map_data.items() for row in cell_rows]
+            return FastJSONResponse(to_columns(project_rows(rows, field_list, text_chars), field_list))
+        if field_list is not None or text_chars is not None:
+            map_data = {cell: project_rows(cell_rows, field_list, text_chars) for cell, cell_rows in map_data.items()}
+        return FastJSONResponse(map_data)
+
+
+def _map_data_from_db(db: Session, topic_filter: Optional[str]):
     query = db.query(Review)
     if topic_filter:
         query = query.filter(Review.topic == topic_filter)
 
-    reviews = query.all()
+    with span("maps.db_fetch"):
+        reviews = query.all()
     map_data = defaultdict(list)
-    for r in reviews:
-        if r.h3_index:
-            map_data[r.h3_index].append({
-                "name": r.name,
-                "text": r.text,
-                "rating": r.rating,
-                "topic": r.topic,
-                "lat": r.lat,
-                "lon": r.lon
-            })
-
-    return dict(map_data)
\ No newline at end of file
+    with span("maps.group"):
+        for r in reviews:
+            if r.h3_index:
+                map_data[r.h3_index].append({
+                    "name": r.name,
+                    "text": r.text,
+                    "rating": r.rating,
+                    "topic": r.topic,
+                    "lat": r.lat,
+                    "lon": r.lon
+                })
+
+    return dict(map_data)
+
+
+@router.get("/html", response_class=HTMLResponse)
+def get_clustered_map(
+    db: Session = Depends(get_db),
+    topic: str = Query(None, description="Filtrar por topic"),
+    neighborhood: str = Query(None, description="Filtrar por barrio")
+):
+    """Mapa agrupado por lugar con cluster en el cliente, cacheado en disco por filtro"""
+    return HTMLResponse(get_clustered_map_html(db, topic=topic, neighborhood=neighborhood))
+
+
+@router.get("/place/{place_id}")
+def get_place_details(place_id: str, db: Session = Depends(get_db)):
+    """Detalle de un lugar para el popup del mapa (reseñas con texto truncado)"""
+    details = place_details(db, place_id)
+    if details is None:
+        raise HTTPException(status_code=404, detail="Lugar no encontrado")
+    return details
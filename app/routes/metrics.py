@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.services.metrics import render_prometheus
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
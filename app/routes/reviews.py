@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, Response
+from fastapi import APIRouter, Depends, HTTPException, Response, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import distinct
 import json
 from app.db.database import get_db
 from app.models.review import Review
 from app.services.scrape_utils import scrape_and_save_reviews
+from app.services.metrics import span
+from app.services.responses import FORMAT_PATTERN, shaped_response, parse_fields
+from typing import Optional
 
 router = APIRouter()
 
@@ -42,31 +45,44 @@ def scrape_reviews(
     scraped = scrape_and_save_reviews(db, query=query, location=location, num=50)
     return {"scraped": scraped}
 
+REVIEWS_JSON_FIELDS = ["id", "place_id", "name", "lat", "lon", "text", "rating", "topic", "h3_index"]
+FLOAT_FIELDS = {"lat", "lon", "rating"}
+
 @router.get("/reviews_json")
-async def get_reviews_json(db: Session = Depends(get_db)):
+async def get_reviews_json(
+    db: Session = Depends(get_db),
+    fields: Optional[str] = Query(None, description="Campos a devolver, separados por coma"),
+    text_chars: Optional[int] = Query(None, ge=0, description="Truncar el texto a N caracteres"),
+    format: str = Query("rows", pattern=FORMAT_PATTERN, description="rows (lista de objetos) o columns (arrays paralelos)")
+):
+    # Con proyección solo se leen de la base las columnas pedidas; los campos desconocidos se ignoran
+    field_list = [f for f in (parse_fields(fields) or REVIEWS_JSON_FIELDS) if f in REVIEWS_JSON_FIELDS]
+    if not field_list:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Ningún campo válido en fields; opciones: {', '.join(REVIEWS_JSON_FIELDS)}"
+        )
     try:
-        
-        reviews = db.query(Review).all()
+        with span("reviews_json.db_fetch"):
+            reviews = db.query(*[getattr(Review, f) for f in field_list]).all()
         reviews_list = []
         
-        for review in reviews:
-            reviews_list.append({
-                "id": review.id,
-                "place_id": review.place_id,
-                "name": review.name,
-                "lat": float(review.lat) if review.lat else None,
-                "lon": float(review.lon) if review.lon else None,
-                "text": review.text,
-                "rating": float(review.rating) if review.rating else None,
-                "topic": review.topic,
-                "h3_index": review.h3_index
-            })
+        with span("reviews_json.build"):
+            for review in reviews:
+                reviews_list.append({
+                    f: (float(v) if v else None) if f in FLOAT_FIELDS else v
+                    for f, v in zip(field_list, review)
+                })
         
         
-        with open("app/static/reviews.json", "w", encoding="utf-8") as f:
-            json.dump(reviews_list, f, ensure_ascii=False, indent=2)
+        # El archivo estático es el export completo; no se pisa con respuestas proyectadas
+        if field_list == REVIEWS_JSON_FIELDS and text_chars is None:
+            with span("reviews_json.write_file"):
+                with open("app/static/reviews.json", "w", encoding="utf-8") as f:
+                    json.dump(reviews_list, f, ensure_ascii=False, indent=2)
         
-        return reviews_list
+        with span("reviews_json.serialize"):
+            return shaped_response(reviews_list, text_chars=text_chars, fmt=format)
     except Exception as e:
         print(f"Error obteniendo reviews: {str(e)}")
         return []
@@ -1,10 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.db.database import get_db
 from app.models.review import Review
-from app.services.topic_model import run_topic_modeling, find_similar_to_query
+from app.services.topic_model import find_similar_to_query
+from app.services.jobs import KIND_TOPIC_MODELING, enqueue_job
 from typing import Optional, List, Dict
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from app.services.metrics import span
+from app.services.snapshot import get_snapshot, find_similar_to_query_snapshot
+from app.services.responses import FORMAT_PATTERN, shaped_response
+from app.services.geo_search import (
+    DEFAULT_RADIUS_KM, MAX_RADIUS_KM, SIMILARITY_WEIGHT, RATING_WEIGHT, DISTANCE_WEIGHT,
+    find_nearby, find_nearby_snapshot,
+)
+from app.services.topic_model import MAX_RESULTS
 
 router = APIRouter()
 
@@ -13,6 +22,9 @@ class SearchRequest(BaseModel):
     topic: Optional[str] = None
     query: Optional[str] = None
     min_rating: Optional[float] = None
+    fields: Optional[str] = None
+    text_chars: Optional[int] = Field(None, ge=0)
+    format: str = Field("rows", pattern=FORMAT_PATTERN)
 
 @router.post("/search")
 def search_places(request: SearchRequest, db: Session = Depends(get_db)):
@@ -26,14 +38,24 @@ def search_places(request: SearchRequest, db: Session = Depends(get_db)):
         min_rating = request.min_rating if request.min_rating else 0.0
         
         
-        results = find_similar_to_query(
-            db=db,
-            query=query,
-            neighborhood=neighborhood,
-            min_rating=min_rating
-        )
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            results = find_similar_to_query_snapshot(
+                snapshot,
+                query=query,
+                neighborhood=neighborhood,
+                min_rating=min_rating
+            )
+        else:
+            results = find_similar_to_query(
+                db=db,
+                query=query,
+                neighborhood=neighborhood,
+                min_rating=min_rating
+            )
         
-        return results
+        with span("search.serialize"):
+            return shaped_response(results, fields=request.fields, text_chars=request.text_chars, fmt=request.format)
         
     except Exception as e:
         print(f"Error en búsqueda: {str(e)}")  
@@ -42,26 +64,83 @@ def search_places(request: SearchRequest, db: Session = Depends(get_db)):
             detail=f"Error en la búsqueda: {str(e)}"
         )
 
-@router.post("/run_topic_modeling")
-def run_topic_modeling_endpoint(db: Session = Depends(get_db)):
+class NearbySearchRequest(BaseModel):
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+    radius_km: float = Field(DEFAULT_RADIUS_KM, gt=0, le=MAX_RADIUS_KM)
+    query: Optional[str] = None
+    review_id: Optional[int] = None
+    min_rating: Optional[float] = None
+    limit: int = Field(MAX_RESULTS, ge=1, le=100)
+    similarity_weight: float = Field(SIMILARITY_WEIGHT, ge=0)
+    rating_weight: float = Field(RATING_WEIGHT, ge=0)
+    distance_weight: float = Field(DISTANCE_WEIGHT, ge=0)
+    fields: Optional[str] = None
+    text_chars: Optional[int] = Field(None, ge=0)
+    format: str = Field("rows", pattern=FORMAT_PATTERN)
+
+@router.post("/search_nearby")
+def search_nearby(request: NearbySearchRequest, db: Session = Depends(get_db)):
+    """
+    Busca lugares a menos de `radius_km` del punto, parecidos a `query` (o a la reseña `review_id`)
+    """
     try:
-        topic_model = run_topic_modeling(db)
-        if topic_model:
-            return {"message": "Topic modeling completado exitosamente"}
+        params = dict(
+            lat=request.lat,
+            lon=request.lon,
+            radius_km=request.radius_km,
+            query=request.query,
+            review_id=request.review_id,
+            min_rating=request.min_rating or 0.0,
+            n_similar=request.limit,
+            similarity_weight=request.similarity_weight,
+            rating_weight=request.rating_weight,
+            distance_weight=request.distance_weight,
+        )
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            results = find_nearby_snapshot(snapshot, **params)
         else:
-            return {"message": "No se pudo completar el topic modeling"}
+            results = find_nearby(db, **params)
+
+        with span("nearby.serialize"):
+            return shaped_response(results, fields=request.fields, text_chars=request.text_chars, fmt=request.format)
+
+    except Exception as e:
+        print(f"Error en búsqueda por cercanía: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error en la búsqueda por cercanía: {str(e)}"
+        )
+
+@router.post("/run_topic_modeling", status_code=202)
+def run_topic_modeling_endpoint(db: Session = Depends(get_db)):
+    """
+    Encola el reajuste de tópicos; el progreso se consulta en GET /jobs/{job_id}
+    """
+    try:
+        job = enqueue_job(db, KIND_TOPIC_MODELING)
+        return {
+            "message": "Topic modeling encolado",
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}",
+        }
     except Exception as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Error ejecutando topic modeling: {str(e)}"
+            detail=f"Error encolando topic modeling: {str(e)}"
         )
 
 @router.get("/topics")
 def get_topics(db: Session = Depends(get_db)):
     """Retorna la lista de tópicos disponibles"""
     try:
-        
-        topics = db.query(Review.topic).distinct().filter(Review.topic.isnot(None)).all()
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            return {str(i): topic.strip() for i, topic in enumerate(snapshot.topics) if topic.strip()}
+
+        with span("topics.db_fetch_distinct"):
+            topics = db.query(Review.topic).distinct().filter(Review.topic.isnot(None)).all()
         topics_dict = {}
         for i, (topic,) in enumerate(topics):
             if topic:
@@ -79,7 +158,10 @@ def get_topics(db: Session = Depends(get_db)):
 @router.get("/similar/{review_id}")
 def get_similar_places_endpoint(
     review_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    fields: Optional[str] = Query(None, description="Campos a devolver, separados por coma"),
+    text_chars: Optional[int] = Query(None, ge=0, description="Truncar el texto a N caracteres"),
+    format: str = Query("rows", pattern=FORMAT_PATTERN, description="rows (lista de objetos) o columns (arrays paralelos)")
 ) -> List[Dict]:
     """
     Retorna lugares similares para un lugar específico basado en su ID
@@ -87,25 +169,28 @@ def get_similar_places_endpoint(
     try:
         from app.services.topic_model import get_similar_reviews
         
-        similar_places = get_similar_reviews(db, review_id)
-        
-        if not similar_places:
-            return []
-            
-        results = []
-        for review, similarity in similar_places:
-            results.append({
-                "place_id": review.place_id,
-                "name": review.name,
-                "lat": float(review.lat) if review.lat else None,
-                "lon": float(review.lon) if review.lon else None,
-                "rating": float(review.rating) if review.rating else None,
-                "text": review.text,
-                "topic": review.topic,
-                "similarity_score": float(similarity)
-            })
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            results = snapshot.similar(review_id)
+        else:
+            similar_places = get_similar_reviews(db, review_id)
+
+            results = []
+            with span("similar.build_response"):
+                for review, similarity in similar_places:
+                    results.append({
+                        "place_id": review.place_id,
+                        "name": review.name,
+                        "lat": float(review.lat) if review.lat else None,
+                        "lon": float(review.lon) if review.lon else None,
+                        "rating": float(review.rating) if review.rating else None,
+                        "text": review.text,
+                        "topic": review.topic,
+                        "similarity_score": float(similarity)
+                    })
             
-        return results
+        with span("similar.serialize"):
+            return shaped_response(results, fields=fields, text_chars=text_chars, fmt=format)
         
     except Exception as e:
         print(f"Error obteniendo lugares similares: {str(e)}")  # Log para debugging
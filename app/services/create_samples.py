@@ -0,0 +1,256 @@
+"""Generador de reseñas sintéticas para pruebas y benchmarks.
+
+Genera N reseñas con texto en español/inglés, distribución de ratings sesgada
+hacia 4-5 estrellas (como en Google Maps), popularidad de lugares tipo Zipf y
+coordenadas dentro de CABA. Sirve para `make samples` y para la suite de
+benchmarks en `app.benchmarks`.
+"""
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+from app.models.review import Review
+
+# Mismos límites que usa el scraper para descartar lugares fuera de CABA
+LAT_MIN, LAT_MAX = -34.7, -34.5
+LON_MIN, LON_MAX = -58.5, -58.3
+
+INSERT_CHUNK_SIZE = 5000
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+# Centroides aproximados de algunos barrios (lat, lon, peso relativo de bares)
+NEIGHBORHOODS = [
+    ("Palermo", -34.5885, -58.4300, 10),
+    ("Villa Crespo", -34.5990, -58.4400, 5),
+    ("Recoleta", -34.5875, -58.3974, 6),
+    ("San Telmo", -34.6215, -58.3731, 6),
+    ("Monserrat", -34.6123, -58.3817, 4),
+    ("San Nicolás", -34.6037, -58.3816, 5),
+    ("Belgrano", -34.5627, -58.4563, 5),
+    ("Colegiales", -34.5737, -58.4489, 3),
+    ("Chacarita", -34.5869, -58.4533, 3),
+    ("Almagro", -34.6100, -58.4200, 3),
+    ("Caballito", -34.6186, -58.4420, 3),
+    ("Boedo", -34.6300, -58.4180, 2),
+    ("Núñez", -34.5450, -58.4630, 2),
+    ("Puerto Madero", -34.6110, -58.3630, 2),
+    ("Retiro", -34.5925, -58.3760, 2),
+    ("Villa Urquiza", -34.5730, -58.4870, 2),
+    ("Barracas", -34.6460, -58.3830, 1),
+    ("La Boca", -34.6345, -58.3631, 1),
+    ("Flores", -34.6280, -58.4630, 1),
+    ("Saavedra", -34.5540, -58.4850, 1),
+]
+
+CATEGORIES = [
+    ("Bar", ["Bar", "Bodegón", "Taberna"]),
+    ("Pub", ["Pub", "Cervecería", "Brewhouse"]),
+    ("Restaurant", ["Parrilla", "Restaurante", "Cantina", "Pizzería"]),
+    ("Cafe", ["Café", "Confitería"]),
+    ("Wine bar", ["Vinoteca", "Wine Bar"]),
+]
+
+NAME_WORDS = [
+    "El Federal", "La Esquina", "Don Julio", "Los Amigos", "La Birra", "El Preferido",
+    "Lupulus", "Malbec", "La Cumbre", "El Faro", "Quilmes", "Rivadavia", "El Tano",
+    "La Perla", "Sur", "Norte", "Tango", "Gardel", "La Fábrica", "El Refugio",
+    "Patagonia", "Antares", "Las Violetas", "El Galgo", "La Negra", "Barrio",
+]
+
+# Frases por idioma y sentimiento; se combinan 2-4 por reseña
+PHRASES = {
+    "es": {
+        "pos": [
+            "Excelente atención y muy buena onda",
+            "La cerveza artesanal es de lo mejor del barrio",
+            "Las pizzas son increíbles y salen rápido",
+            "Muy buen ambiente para ir con amigos",
+            "Los tragos están muy bien preparados",
+            "La carne estaba en su punto justo",
+            "Gran variedad de vinos a buen precio",
+            "El happy hour vale totalmente la pena",
+            "Música en vivo los fines de semana",
+            "Las empanadas son caseras y riquísimas",
+        ],
+        "neu": [
+            "Precios razonables para la zona",
+            "Se llena bastante después de las diez",
+            "Tiene mesas afuera en la vereda",
+            "La carta es corta pero variada",
+            "Conviene reservar los viernes",
+        ],
+        "neg": [
+            "La atención fue lenta y desorganizada",
+            "La comida llegó fría",
+            "Demasiado ruido, no se puede hablar",
+            "Caro para lo que ofrece",
+            "El baño estaba sucio",
+        ],
+    },
+    "en": {
+        "pos": [
+            "Great craft beer selection and friendly staff",
+            "Amazing steak, cooked perfectly",
+            "Cozy atmosphere, perfect for a date",
+            "The cocktails are creative and well balanced",
+            "Best pizza we had in Buenos Aires",
+            "Lovely terrace and live music",
+            "Excellent wine list at fair prices",
+            "Happy hour deals are really good",
+        ],
+        "neu": [
+            "Prices are average for the area",
+            "Gets crowded late at night",
+            "Small menu but decent options",
+            "Card payments accepted",
+        ],
+        "neg": [
+            "Service was slow and the waiter was rude",
+            "Food was cold and overpriced",
+            "Too loud to have a conversation",
+            "Long wait even with a reservation",
+        ],
+    },
+}
+
+SPANISH_RATIO = 0.6
+
+
+def _clip(value: float, low: float, high: float) -> float:
+    return max(low, min(high, value))
+
+
+def generate_places(n_places: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """Genera lugares con barrio, categoría, calidad base y peso de popularidad."""
+    weights = [w for _, _, _, w in NEIGHBORHOODS]
+    places = []
+    for i in range(n_places):
+        barrio, lat_c, lon_c, _ = rng.choices(NEIGHBORHOODS, weights=weights)[0]
+        category, prefixes = rng.choice(CATEGORIES)
+        name = f"{rng.choice(prefixes)} {rng.choice(NAME_WORDS)}"
+        if rng.random() < 0.3:
+            name = f"{name} {barrio}"
+        places.append({
+            "place_id": f"synthetic_{i:07d}",
+            "name": name,
+            "category": category,
+            "lat": _clip(rng.gauss(lat_c, 0.006), LAT_MIN, LAT_MAX),
+            "lon": _clip(rng.gauss(lon_c, 0.006), LON_MIN, LON_MAX),
+            "quality": _clip(rng.gauss(4.2, 0.45), 1.5, 5.0),
+            # Popularidad tipo Zipf: pocos lugares concentran muchas reseñas
+            "weight": 1.0 / ((i + 1) ** 1.1),
+        })
+    return places
+
+
+def _review_text(rating: int, language: str, rng: random.Random) -> str:
+    phrases = PHRASES[language]
+    if rating >= 4:
+        pools = ["pos", "pos", "neu"]
+    elif rating == 3:
+        pools = ["neu", "pos", "neg"]
+    else:
+        pools = ["neg", "neg", "neu"]
+    n_sentences = rng.randint(2, 4)
+    sentences = [rng.choice(phrases[rng.choice(pools)]) for _ in range(n_sentences)]
+    return ". ".join(dict.fromkeys(sentences)) + "."
+
+
+def generate_reviews(n: int, seed: int = 42, n_places: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Genera N reseñas sintéticas como dicts con las columnas de `Review`.
+
+    Es un generador para poder producir 1M de filas sin tenerlas todas en memoria.
+    Con la misma semilla siempre devuelve los mismos datos.
+    """
+    rng = random.Random(seed)
+    if n_places is None:
+        n_places = max(20, n // 25)
+    places = generate_places(n_places, rng)
+    weights = [p["weight"] for p in places]
+    now = datetime(2024, 6, 1)
+
+    # Elegimos los lugares en tandas para no llamar a choices() fila por fila
+    chunk = 10_000
+    emitted = 0
+    while emitted < n:
+        size = min(chunk, n - emitted)
+        for place in rng.choices(places, weights=weights, k=size):
+            rating = int(round(_clip(rng.gauss(place["quality"], 0.8), 1, 5)))
+            language = "es" if rng.random() < SPANISH_RATIO else "en"
+            yield {
+                "place_id": place["place_id"],
+                "name": place["name"],
+                "lat": place["lat"],
+                "lon": place["lon"],
+                "category": place["category"],
+                "rating": float(rating),
+                "text": _review_text(rating, language, rng),
+                "language": language,
+                "created_at": now - timedelta(minutes=rng.randint(0, 3 * 365 * 24 * 60)),
+                "source": "synthetic",
+            }
+        emitted += size
+
+
+def save_samples(db: Session, n: int, seed: int = 42, chunk_size: int = INSERT_CHUNK_SIZE) -> int:
+    """Inserta N reseñas sintéticas en la base en tandas de `chunk_size`."""
+    inserted = 0
+    batch: List[Dict[str, Any]] = []
+    for review in generate_reviews(n, seed=seed):
+        batch.append(review)
+        if len(batch) >= chunk_size:
+            db.bulk_insert_mappings(Review, batch)
+            db.commit()
+            inserted += len(batch)
+            batch = []
+            print(f"[Samples] {inserted}/{n} reseñas insertadas...")
+    if batch:
+        db.bulk_insert_mappings(Review, batch)
+        db.commit()
+        inserted += len(batch)
+    print(f"[Samples] Proceso finalizado. Total: {inserted}")
+    return inserted
+
+
+def export_samples_json(filepath: str, n: int, seed: int = 42):
+    """Escribe N reseñas sintéticas en un archivo JSON (formato de data/example_reviews.json)."""
+    data = []
+    for r in generate_reviews(n, seed=seed):
+        r["created_at"] = r["created_at"].isoformat()
+        data.append(r)
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"[Samples] {len(data)} reseñas exportadas a {filepath}")
+
+
+def parse_scale(value: str) -> int:
+    """Acepta un número (`2500`) o una escala con nombre (`1k`, `10k`, `100k`, `1m`)."""
+    key = value.strip().lower()
+    if key in SCALES:
+        return SCALES[key]
+    return int(key)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera reseñas sintéticas en CABA")
+    parser.add_argument("-n", "--num", default="1k", help="Cantidad de reseñas o escala (1k, 10k, 100k, 1m)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", default=None,
+                        help="Escribir a un archivo JSON en lugar de la base de datos")
+    args = parser.parse_args()
+
+    n = parse_scale(args.num)
+    if args.json_path:
+        export_samples_json(args.json_path, n, seed=args.seed)
+        return
+
+    from app.db.database import get_db
+    db = next(get_db())
+    save_samples(db, n, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
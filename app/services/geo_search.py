@@ -0,0 +1,223 @@
+"""Búsqueda por cercanía ("lugares como X a menos de 1 km de acá").
+
+En lugar de recorrer toda la tabla, el punto y el radio se traducen a las
+celdas H3 que lo cubren (k-ring a la resolución guardada en `h3_index`) y solo
+se leen las reseñas de esas celdas con una consulta indexada. La cantidad de
+candidatos depende de la densidad de la zona, no del tamaño del corpus.
+
+El ranking mezcla, con pesos configurables, la similitud coseno contra la
+consulta (como `find_similar_to_query`), el rating y la cercanía (haversine
+vectorizado con numpy).
+"""
+import json
+import math
+from typing import Dict, List, Optional, Sequence
+
+import h3
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from sqlalchemy.orm import Session
+
+from app.models.review import Review
+from app.services.metrics import SIZE_BUCKETS, inc, observe, span
+from app.services.topic_model import H3_RESOLUTION, MAX_RESULTS, SIMILARITY_THRESHOLD, get_model
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_RADIUS_KM = 1.0
+MAX_RADIUS_KM = 10.0
+SIMILARITY_WEIGHT = 0.5
+RATING_WEIGHT = 0.2
+DISTANCE_WEIGHT = 0.3
+# Límite de parámetros por IN (...) para no pasarse del máximo de SQLite
+ID_CHUNK = 500
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Distancia en km desde (lat, lon) a cada punto de (lats, lons)."""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lons, dtype=np.float64))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def covering_cells(lat: float, lon: float, radius_km: float, resolution: int = H3_RESOLUTION) -> List[str]:
+    """Celdas H3 que cubren el círculo de `radius_km` alrededor del punto.
+
+    El punto puede estar en cualquier lugar de su celda, así que se suma una
+    arista al radio; cada anillo avanza al menos 1.5 aristas. Sobra un poco de
+    área, pero el filtro exacto por distancia se hace después.
+    """
+    edge_km = h3.edge_length(resolution, unit="km")
+    k = max(1, math.ceil((radius_km + edge_km) / (1.5 * edge_km)))
+    return sorted(h3.k_ring(h3.geo_to_h3(lat, lon, resolution), k))
+
+
+def blend_scores(similarities: Optional[np.ndarray], ratings: np.ndarray, distances: np.ndarray, radius_km: float,
+                 similarity_weight: float = SIMILARITY_WEIGHT, rating_weight: float = RATING_WEIGHT,
+                 distance_weight: float = DISTANCE_WEIGHT) -> np.ndarray:
+    """Puntaje combinado; sin similitud (consulta vacía) solo pesan rating y cercanía."""
+    closeness = 1.0 - np.clip(distances / radius_km, 0.0, 1.0)
+    scores = rating_weight * (ratings / 5.0) + distance_weight * closeness
+    if similarities is not None:
+        scores = scores + similarity_weight * similarities
+    return scores
+
+
+def _encode_query(query: Optional[str]) -> Optional[np.ndarray]:
+    if not query or not query.strip():
+        return None
+    observe("encode_batch_size", 1, buckets=SIZE_BUCKETS, op="nearby")
+    with span("nearby.encode_query"):
+        return np.asarray(get_model().encode(query.strip()), dtype=np.float32)
+
+
+def _chunks(values: Sequence, size: int = ID_CHUNK):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _rank(candidates: List[Dict], similarities: Optional[np.ndarray], ratings: np.ndarray, distances: np.ndarray,
+          radius_km: float, n_similar: int, threshold: float, weights: Dict[str, float]) -> List[Dict]:
+    with span("nearby.rank"):
+        if similarities is not None:
+            keep = similarities > threshold
+            candidates = [c for c, k in zip(candidates, keep) if k]
+            similarities, ratings, distances = similarities[keep], ratings[keep], distances[keep]
+        scores = blend_scores(similarities, ratings, distances, radius_km, **weights)
+        top = np.argsort(-scores, kind="stable")[:n_similar]
+        results = []
+        for i in top:
+            item = dict(candidates[i])
+            item["rating"] = float(ratings[i])
+            item["similarity_score"] = float(similarities[i]) if similarities is not None else 1.0
+            item["distance_km"] = round(float(distances[i]), 3)
+            item["score"] = float(scores[i])
+            results.append(item)
+    return results
+
+
+def find_nearby(db: Session, lat: float, lon: float, radius_km: float = DEFAULT_RADIUS_KM,
+                query: Optional[str] = None, review_id: Optional[int] = None, min_rating: float = 0.0,
+                n_similar: int = MAX_RESULTS, threshold: float = SIMILARITY_THRESHOLD,
+                similarity_weight: float = SIMILARITY_WEIGHT, rating_weight: float = RATING_WEIGHT,
+                distance_weight: float = DISTANCE_WEIGHT) -> List[Dict]:
+    """Lugares a menos de `radius_km` de (lat, lon), parecidos a `query` o a la reseña `review_id`.
+
+    Primero trae solo (id, lat, lon, rating) de las celdas H3 que cubren el
+    círculo y filtra por distancia exacta; recién para los que quedan adentro
+    se leen texto y embedding.
+    """
+    print(f"[Nearby] ({lat}, {lon}) r={radius_km} km, query: '{query or ''}', review_id: {review_id}")
+    weights = {"similarity_weight": similarity_weight, "rating_weight": rating_weight,
+               "distance_weight": distance_weight}
+
+    query_embedding = None
+    if review_id is not None:
+        reference = db.query(Review.embedding).filter(Review.id == review_id).first()
+        if reference is None or reference[0] is None:
+            return []
+        query_embedding = np.asarray(json.loads(reference[0]), dtype=np.float32)
+    else:
+        query_embedding = _encode_query(query)
+
+    cells = covering_cells(lat, lon, radius_km)
+    with span("nearby.db_fetch_cells"):
+        cell_query = db.query(Review.id, Review.lat, Review.lon, Review.rating).filter(
+            Review.h3_index.in_(cells), Review.lat.isnot(None), Review.lon.isnot(None))
+        if min_rating > 0:
+            cell_query = cell_query.filter(Review.rating >= min_rating)
+        if query_embedding is not None:
+            cell_query = cell_query.filter(Review.embedding.isnot(None))
+        if review_id is not None:
+            cell_query = cell_query.filter(Review.id != review_id)
+        rows = cell_query.all()
+    inc("rows_scanned_total", len(rows), op="nearby")
+    if not rows:
+        return []
+
+    with span("nearby.distance"):
+        ids = np.array([r[0] for r in rows], dtype=np.int64)
+        distances = haversine_km(lat, lon, [r[1] for r in rows], [r[2] for r in rows])
+        inside = distances <= radius_km
+        ids, distances = ids[inside], distances[inside]
+    print(f"[Nearby] {len(rows)} reseñas en {len(cells)} celdas, {len(ids)} dentro del radio")
+    if len(ids) == 0:
+        return []
+
+    with span("nearby.db_fetch_rows"):
+        reviews = {}
+        for chunk in _chunks(ids.tolist()):
+            for r in db.query(Review).filter(Review.id.in_(chunk)):
+                reviews[r.id] = r
+    ordered = [reviews[i] for i in ids.tolist()]
+    candidates = [{
+        "id": r.id,
+        "place_id": r.place_id,
+        "name": r.name,
+        "lat": float(r.lat),
+        "lon": float(r.lon),
+        "text": r.text,
+        "topic": r.topic,
+    } for r in ordered]
+    ratings = np.array([float(r.rating) if r.rating else 0.0 for r in ordered], dtype=np.float32)
+
+    similarities = None
+    if query_embedding is not None:
+        with span("nearby.decode_embeddings"):
+            embeddings = np.array([json.loads(r.embedding) for r in ordered])
+        with span("nearby.scoring"):
+            similarities = cosine_similarity([query_embedding], embeddings)[0]
+        inc("vectors_scored_total", len(ordered), op="nearby")
+
+    return _rank(candidates, similarities, ratings, distances, radius_km, n_similar, threshold, weights)
+
+
+def find_nearby_snapshot(snapshot, lat: float, lon: float, radius_km: float = DEFAULT_RADIUS_KM,
+                         query: Optional[str] = None, review_id: Optional[int] = None, min_rating: float = 0.0,
+                         n_similar: int = MAX_RESULTS, threshold: float = SIMILARITY_THRESHOLD,
+                         similarity_weight: float = SIMILARITY_WEIGHT, rating_weight: float = RATING_WEIGHT,
+                         distance_weight: float = DISTANCE_WEIGHT) -> List[Dict]:
+    """Igual que `find_nearby` pero leyendo del snapshot (índice por celda en memoria)."""
+    print(f"[Nearby] (snapshot {snapshot.version}) ({lat}, {lon}) r={radius_km} km, query: '{query or ''}'")
+    weights = {"similarity_weight": similarity_weight, "rating_weight": rating_weight,
+               "distance_weight": distance_weight}
+
+    exclude = None
+    if review_id is not None:
+        exclude = snapshot.row_for_id(review_id)
+        if exclude is None or not snapshot.has_embedding[exclude]:
+            return []
+        query_embedding = np.asarray(snapshot.embeddings[exclude], dtype=np.float32)
+    else:
+        query_embedding = _encode_query(query)
+
+    cells = covering_cells(lat, lon, radius_km)
+    rows = snapshot.rows_in_cells(cells)
+    inc("rows_scanned_total", len(rows), op="snapshot_nearby")
+    rating = np.nan_to_num(np.asarray(snapshot.rating[rows], dtype=np.float32), nan=0.0)
+    mask = ~np.isnan(snapshot.lat[rows]) & ~np.isnan(snapshot.lon[rows])
+    if min_rating > 0:
+        mask &= rating >= min_rating
+    if query_embedding is not None:
+        mask &= np.asarray(snapshot.has_embedding[rows])
+    if exclude is not None:
+        mask &= rows != exclude
+    rows, rating = rows[mask], rating[mask]
+
+    with span("nearby.distance"):
+        distances = haversine_km(lat, lon, snapshot.lat[rows], snapshot.lon[rows])
+        inside = distances <= radius_km
+        rows, rating, distances = rows[inside], rating[inside], distances[inside]
+    if len(rows) == 0:
+        return []
+
+    similarities = None
+    if query_embedding is not None:
+        with span("nearby.scoring"):
+            q = query_embedding / (np.linalg.norm(query_embedding) or 1.0)
+            similarities = np.asarray(snapshot.embeddings[rows] @ q)
+        inc("vectors_scored_total", len(rows), op="snapshot_nearby")
+
+    candidates = [dict(snapshot.place_dict(int(r)), id=int(snapshot.ids[r])) for r in rows]
+    return _rank(candidates, similarities, rating, distances, radius_km, n_similar, threshold, weights)
@@ -0,0 +1,329 @@
+"""Servidor de inferencia local compartido por los workers web.
+
+Un único proceso carga el SentenceTransformer y atiende pedidos de encode por
+un Unix socket. Así, con `uvicorn --workers N` cada worker no importa torch ni
+carga su propia copia del modelo: se conectan con `RemoteEncoder`, que tiene
+la misma interfaz `encode()` que SentenceTransformer.
+
+Los pedidos de distintos clientes se juntan en micro-batches de hasta
+MAX_BATCH textos: mientras el modelo está ocupado los pedidos se acumulan en
+la cola y salen juntos en el siguiente llamado. Con --max-wait-ms > 0 además se
+espera ese tiempo a que lleguen más pedidos (más throughput, más latencia).
+
+Protocolo (todo big-endian, un pedido por vez por conexión):
+
+    pedido:     uint32 largo | JSON UTF-8 con la lista de textos
+    respuesta:  uint32 n | uint32 dim | n*dim float32 little-endian
+    error:      uint32 0xFFFFFFFF | uint32 largo | mensaje UTF-8
+
+Los vectores viajan como float32 crudos, sin pasar por JSON.
+
+    python -m app.services.inference_server --socket /tmp/bares_encoder.sock
+    ENCODER_SOCKET=/tmp/bares_encoder.sock uvicorn app.main:app --workers 4
+"""
+import argparse
+import gc
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from app.services.metrics import span, inc, observe, SIZE_BUCKETS
+
+DEFAULT_SOCKET = "/tmp/bares_encoder.sock"
+MAX_BATCH = 64
+MAX_WAIT_MS = 0
+ENCODE_BATCH_SIZE = 32
+CONNECT_TIMEOUT = 2.0
+REQUEST_TIMEOUT = 60.0
+RETRY_AFTER_SECONDS = 30.0
+
+_HEADER = struct.Struct("!I")
+_SHAPE = struct.Struct("!II")
+_ERROR = 0xFFFFFFFF
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("Conexión cerrada por el otro extremo")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def embedding_dim(model) -> int:
+    """Dimensión de los embeddings del modelo (como `get_sentence_embedding_dimension`)."""
+    get_dim = getattr(model, "get_sentence_embedding_dimension", None)
+    dim = get_dim() if get_dim is not None else getattr(model, "dim", None)
+    if not dim:
+        dim = np.asarray(model.encode(["dim"], show_progress_bar=False, convert_to_numpy=True)).shape[-1]
+    return int(dim)
+
+
+class _Pending:
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.done = threading.Event()
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[Exception] = None
+
+
+class MicroBatcher:
+    """Junta pedidos concurrentes y los codifica en un solo llamado al modelo."""
+
+    def __init__(self, model, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._dim: Optional[int] = None
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="encoder-batcher", daemon=True)
+        self._thread.start()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            if self._dim is None:
+                self._dim = embedding_dim(self.model)
+            return np.zeros((0, self._dim), dtype=np.float32)
+        pending = _Pending(texts)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect(self) -> List[_Pending]:
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [t for p in batch for t in p.texts]
+            observe("encode_batch_size", len(texts), buckets=SIZE_BUCKETS, op="inference_server")
+            try:
+                with span("inference_server.encode"):
+                    vectors = np.asarray(self.model.encode(
+                        texts,
+                        batch_size=ENCODE_BATCH_SIZE,
+                        show_progress_bar=False,
+                        convert_to_numpy=True,
+                        device='cpu'
+                    ), dtype=np.float32)
+                start = 0
+                for p in batch:
+                    p.result = vectors[start:start + len(p.texts)]
+                    start += len(p.texts)
+            except Exception as e:
+                for p in batch:
+                    p.error = e
+            for p in batch:
+                p.done.set()
+
+
+class _EncodeHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        while True:
+            try:
+                (length,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+                body = _recv_exact(sock, length)
+            except (ConnectionError, OSError):
+                return
+            try:
+                texts = json.loads(body.decode("utf-8"))
+                if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                    raise ValueError("El pedido debe ser una lista JSON de textos")
+                vectors = self.server.batcher.encode(texts)
+                inc("inference_requests_total", status="ok")
+                response = _SHAPE.pack(*vectors.shape) + vectors.astype("<f4", copy=False).tobytes()
+            except Exception as e:
+                inc("inference_requests_total", status="error")
+                message = str(e).encode("utf-8")
+                response = _SHAPE.pack(_ERROR, len(message)) + message
+            try:
+                sock.sendall(response)
+            except (ConnectionError, OSError):
+                # El cliente se fue (p. ej. venció su timeout)
+                return
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, model, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        self.batcher = MicroBatcher(model, max_batch=max_batch, max_wait_ms=max_wait_ms)
+        super().__init__(socket_path, _EncodeHandler)
+
+
+class EncoderUnavailable(ConnectionError):
+    """No hay servidor escuchando: el socket no existe o rechaza la conexión."""
+
+
+class RemoteEncoder:
+    """Cliente del servidor de inferencia con la interfaz `encode()` de SentenceTransformer.
+
+    Mantiene una conexión por thread. Solo si el servidor no está levantado
+    (socket inexistente o conexión rechazada) y hay `fallback`, carga el modelo
+    en este proceso y vuelve a probar el servidor cada RETRY_AFTER_SECONDS; en
+    cuanto el servidor responde, libera esa copia local. Un timeout o un error
+    a mitad de pedido se propaga sin cargar el modelo: suele significar que el
+    servidor está sobrecargado, y que cada worker cargue torch lo empeoraría.
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, fallback: Optional[Callable[[], object]] = None):
+        self.socket_path = socket_path
+        self._fallback_factory = fallback
+        self._fallback_model = None
+        self._fallback_lock = threading.Lock()
+        self._local = threading.local()
+        self._down_until = 0.0
+        self._dim: Optional[int] = None
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(CONNECT_TIMEOUT)
+            try:
+                sock.connect(self.socket_path)
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                sock.close()
+                raise EncoderUnavailable(f"Servidor de inferencia no disponible en {self.socket_path}: {e}") from e
+            except OSError:
+                sock.close()
+                raise
+            sock.settimeout(REQUEST_TIMEOUT)
+            self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                sock.close()
+            finally:
+                self._local.sock = None
+
+    def _remote_encode(self, texts: List[str]) -> np.ndarray:
+        payload = json.dumps(texts, ensure_ascii=False).encode("utf-8")
+        while True:
+            reused = getattr(self._local, "sock", None) is not None
+            sock = self._connection()
+            try:
+                sock.sendall(_HEADER.pack(len(payload)) + payload)
+                n, dim = _SHAPE.unpack(_recv_exact(sock, _SHAPE.size))
+                if n == _ERROR:
+                    raise RuntimeError(_recv_exact(sock, dim).decode("utf-8"))
+                data = _recv_exact(sock, n * dim * 4)
+            except socket.timeout:
+                self._close()
+                raise
+            except (ConnectionError, OSError):
+                self._close()
+                # La conexión guardada puede venir de un servidor que se reinició: se reintenta una vez
+                if reused:
+                    continue
+                raise
+            return np.frombuffer(data, dtype="<f4").reshape(n, dim)
+
+    def _local_model(self):
+        with self._fallback_lock:
+            if self._fallback_model is None:
+                print(f"[Encoder] Servidor en {self.socket_path} no disponible, cargando modelo en este proceso")
+                self._fallback_model = self._fallback_factory()
+            return self._fallback_model
+
+    def _release_local_model(self):
+        with self._fallback_lock:
+            if self._fallback_model is None:
+                return
+            print(f"[Encoder] Servidor en {self.socket_path} disponible otra vez, se libera el modelo local")
+            self._fallback_model = None
+        gc.collect()
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, device: Optional[str] = None, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts and self._dim is not None:
+            return np.zeros((0, self._dim), dtype=np.float32)
+
+        vectors = None
+        if time.monotonic() >= self._down_until:
+            try:
+                with span("encoder.remote"):
+                    vectors = self._remote_encode(texts)
+                inc("encoder_calls_total", backend="remote")
+            except EncoderUnavailable as e:
+                if self._fallback_factory is None:
+                    raise
+                print(f"[Encoder] {e}")
+                self._down_until = time.monotonic() + RETRY_AFTER_SECONDS
+            else:
+                self._release_local_model()
+        if vectors is None:
+            inc("encoder_calls_total", backend="local")
+            model = self._local_model()
+            if not texts:
+                vectors = np.zeros((0, embedding_dim(model)), dtype=np.float32)
+            else:
+                with span("encoder.local"):
+                    vectors = np.asarray(model.encode(
+                        texts, batch_size=batch_size, show_progress_bar=False, convert_to_numpy=True, device='cpu'
+                    ), dtype=np.float32)
+        self._dim = vectors.shape[1]
+        return vectors[0] if single else vectors
+
+
+def serve(socket_path: str = DEFAULT_SOCKET, encoder: str = "model",
+          max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS) -> None:
+    if encoder == "stub":
+        from app.benchmarks.common import StubEncoder
+        model = StubEncoder()
+    else:
+        from app.services.topic_model import load_local_model
+        model = load_local_model()
+    server = InferenceServer(socket_path, model, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    print(f"[Encoder] Escuchando en {socket_path} (max_batch={max_batch}, max_wait={max_wait_ms}ms)")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de inferencia compartido (Unix socket)")
+    parser.add_argument("--socket", default=os.getenv("ENCODER_SOCKET", DEFAULT_SOCKET))
+    parser.add_argument("--encoder", choices=["model", "stub"], default="model")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    args = parser.parse_args()
+    serve(args.socket, encoder=args.encoder, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,490 @@
+"""Cola de jobs en segundo plano para refrescar reseñas nuevas sin bloquear la API.
+
+Los jobs se guardan en la tabla `jobs` (estado, etapa y progreso) y los
+ejecuta un pool chico de threads dentro del proceso de la API. Tipos:
+
+- `refresh_reviews`: para una lista de ids (p. ej. las reseñas que acaba de
+  insertar `scrape_and_save_reviews`) calcula embeddings, asigna tópico por
+  centroide más cercano y calcula la celda H3, solo para esas filas.
+- `topic_modeling`: reajuste completo de KMeans (antes corría dentro del
+  request de POST /topic_model/run_topic_modeling).
+
+El trabajo se hace en tandas de `JOB_BATCH_SIZE` filas con una pausa corta
+entre tandas, y con `JOB_WORKERS` threads como máximo, para no competir con los
+requests. Un job encolado desde otro proceso (p. ej. `make scrape`) queda en la
+tabla y lo toma la API al arrancar, o `python -m app.services.jobs`.
+
+Mientras corre, un job renueva `heartbeat_at` cada `JOB_HEARTBEAT_SECONDS`. Si
+el proceso muere, el job queda en `running` con el heartbeat viejo: al arrancar
+la cola, los que superan `JOB_LEASE_SECONDS` sin heartbeat se vuelven a encolar
+(o se marcan fallidos después de `JOB_MAX_ATTEMPTS` intentos). Las etapas solo
+tocan filas incompletas, así que repetir un job es seguro.
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func, or_, update
+from sqlalchemy.orm import Session
+
+from app.models.job import Job
+from app.models.review import Review
+from app.services.metrics import inc, observe
+from app.services.topic_model import (
+    assign_h3, assign_topics, embed_reviews, load_topic_centroids, precompute_embeddings, run_topic_modeling,
+)
+
+KIND_REFRESH = "refresh_reviews"
+KIND_TOPIC_MODELING = "topic_modeling"
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+STAGES = {
+    KIND_REFRESH: ("embed", "topics", "h3"),
+    KIND_TOPIC_MODELING: ("embed", "topics"),
+}
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_BATCH_SIZE = 64
+JOB_PAUSE_SECONDS = 0.05
+JOB_HEARTBEAT_SECONDS = 30
+JOB_LEASE_SECONDS = 300
+JOB_MAX_ATTEMPTS = 3
+
+# Reporta progreso: report(etapa, procesadas, total)
+Reporter = Callable[[str, int, int], None]
+
+
+class JobInterrupted(Exception):
+    """La cola se está apagando: el job se corta entre tandas y vuelve a la cola."""
+
+
+def _now() -> datetime:
+    """UTC sin tzinfo, como el resto de las columnas DateTime de la base."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() + "Z" if value else None
+
+
+def _lease_cutoff(lease_seconds: float = JOB_LEASE_SECONDS) -> datetime:
+    return _now() - timedelta(seconds=lease_seconds)
+
+
+def is_stale(job: Job, lease_seconds: float = JOB_LEASE_SECONDS) -> bool:
+    """True si el job figura corriendo pero su proceso dejó de mandar heartbeats."""
+    last_seen = job.heartbeat_at or job.started_at
+    return job.status == STATUS_RUNNING and (last_seen is None or last_seen < _lease_cutoff(lease_seconds))
+
+
+def _chunks(values: List[int], size: int = JOB_BATCH_SIZE):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def job_to_dict(job: Job) -> Dict[str, Any]:
+    """Estado del job para la API; `progress` va de 0 a 1 sumando todas las etapas."""
+    stages = STAGES.get(job.kind, ())
+    progress = 1.0 if job.status == STATUS_DONE else 0.0
+    if job.status != STATUS_DONE and job.stage in stages:
+        stage_progress = (job.processed or 0) / job.total if job.total else 0.0
+        progress = (stages.index(job.stage) + stage_progress) / len(stages)
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "stage": job.stage,
+        "stages": list(stages),
+        "processed": job.processed or 0,
+        "total": job.total or 0,
+        "progress": round(progress, 3),
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "attempts": job.attempts or 0,
+        "stale": is_stale(job),
+        "created_at": _isoformat(job.created_at),
+        "started_at": _isoformat(job.started_at),
+        "heartbeat_at": _isoformat(job.heartbeat_at),
+        "finished_at": _isoformat(job.finished_at),
+    }
+
+
+# Etapas de cada tipo de job
+
+def run_refresh(db: Session, job: Job, report: Reporter) -> Dict[str, Any]:
+    """Embeddings, tópico y H3 solo para las reseñas del job.
+
+    Sin ids en el payload toma todas las reseñas a las que les falta algo
+    (reemplaza correr `make embeddings` + `make topic` sobre toda la tabla).
+    """
+    payload = json.loads(job.payload) if job.payload else {}
+    ids = payload.get("review_ids")
+    if ids is None:
+        ids = [i for (i,) in db.query(Review.id).filter(or_(
+            Review.embedding.is_(None), Review.topic.is_(None), Review.h3_index.is_(None)
+        )).order_by(Review.id)]
+    ids = sorted(set(ids))
+    counts = {"reviews": len(ids), "embedded": 0, "topics": 0, "h3": 0}
+
+    done = 0
+    for chunk in _chunks(ids):
+        reviews = db.query(Review).filter(Review.id.in_(chunk), Review.text.isnot(None),
+                                          Review.embedding.is_(None)).all()
+        counts["embedded"] += embed_reviews(db, reviews)
+        done += len(chunk)
+        report("embed", done, len(ids))
+
+    if load_topic_centroids() is None:
+        # Base nueva, o los centroides quedaron en otro host: sin ellos no hay
+        # tópico que asignar, así que se encola un reajuste completo
+        counts["topic_modeling_job"] = _ensure_topic_modeling(db)
+        print(f"[Jobs] Sin centroides de tópicos, las reseñas reciben tópico en el job "
+              f"{counts['topic_modeling_job']} ({KIND_TOPIC_MODELING})")
+        report("topics", len(ids), len(ids))
+    else:
+        done = 0
+        for chunk in _chunks(ids):
+            reviews = db.query(Review).filter(Review.id.in_(chunk), Review.embedding.isnot(None),
+                                              Review.topic.is_(None)).all()
+            counts["topics"] += assign_topics(reviews)
+            db.commit()
+            done += len(chunk)
+            report("topics", done, len(ids))
+
+    done = 0
+    for chunk in _chunks(ids):
+        reviews = db.query(Review).filter(Review.id.in_(chunk), Review.h3_index.is_(None),
+                                          Review.lat.isnot(None), Review.lon.isnot(None)).all()
+        for review in reviews:
+            assign_h3(review)
+        counts["h3"] += sum(1 for r in reviews if r.h3_index)
+        db.commit()
+        done += len(chunk)
+        report("h3", done, len(ids))
+    return counts
+
+
+def _ensure_topic_modeling(db: Session) -> int:
+    """Id del reajuste de tópicos en cola o corriendo; si no hay ninguno, lo encola."""
+    pending = db.query(Job.id).filter(Job.kind == KIND_TOPIC_MODELING,
+                                      Job.status.in_([STATUS_QUEUED, STATUS_RUNNING])).first()
+    if pending is not None:
+        return pending[0]
+    return enqueue_job(db, KIND_TOPIC_MODELING).id
+
+
+def run_topic_modeling_job(db: Session, job: Job, report: Reporter) -> Dict[str, Any]:
+    precompute_embeddings(db, progress=lambda done, total: report("embed", done, total))
+    report("topics", 0, 0)
+    ok = run_topic_modeling(db, progress=lambda done, total: report("topics", done, total))
+    return {"completed": bool(ok)}
+
+
+HANDLERS: Dict[str, Callable[[Session, Job, Reporter], Dict[str, Any]]] = {
+    KIND_REFRESH: run_refresh,
+    KIND_TOPIC_MODELING: run_topic_modeling_job,
+}
+
+
+def _claim(db: Session, job_id: int) -> bool:
+    """Pasa el job de queued a running; False si otro worker ya lo tomó."""
+    now = _now()
+    result = db.execute(
+        update(Job).where(Job.id == job_id, Job.status == STATUS_QUEUED)
+        .values(status=STATUS_RUNNING, started_at=now, heartbeat_at=now, error=None,
+                attempts=func.coalesce(Job.attempts, 0) + 1)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+class _Heartbeat:
+    """Thread que renueva `heartbeat_at` del job con su propia sesión.
+
+    Va aparte del job porque hay etapas largas sin puntos de progreso (p. ej.
+    el fit de KMeans) que no deben dejar vencer el lease.
+    """
+
+    def __init__(self, bind, job_id: int, interval: float = JOB_HEARTBEAT_SECONDS):
+        self.bind = bind
+        self.job_id = job_id
+        self.interval = interval
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"job-heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join(timeout=self.interval)
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            db = Session(bind=self.bind)
+            try:
+                db.execute(update(Job).where(Job.id == self.job_id, Job.status == STATUS_RUNNING)
+                           .values(heartbeat_at=_now()))
+                db.commit()
+            except Exception as e:
+                print(f"[Jobs] Error renovando heartbeat del job {self.job_id}: {e}")
+            finally:
+                db.close()
+
+
+def execute_job(db: Session, job_id: int, pause: float = JOB_PAUSE_SECONDS,
+                stop: Optional[threading.Event] = None,
+                heartbeat_seconds: float = JOB_HEARTBEAT_SECONDS) -> Optional[Job]:
+    """Ejecuta un job encolado en la sesión dada. Devuelve None si no se pudo tomar.
+
+    Si `stop` se activa, el job se corta en el próximo punto de progreso y
+    vuelve a quedar encolado.
+    """
+    if not _claim(db, job_id):
+        return None
+    job = db.get(Job, job_id)
+    print(f"[Jobs] Job {job.id} ({job.kind}) iniciado (intento {job.attempts})")
+    start = time.perf_counter()
+
+    def report(stage: str, processed: int, total: int) -> None:
+        job.stage, job.processed, job.total = stage, processed, total
+        job.heartbeat_at = _now()
+        db.commit()
+        if stop is not None and stop.is_set():
+            raise JobInterrupted()
+        if pause:
+            time.sleep(pause)
+
+    try:
+        handler = HANDLERS.get(job.kind)
+        if handler is None:
+            raise ValueError(f"Tipo de job desconocido: {job.kind}")
+        with _Heartbeat(db.get_bind(), job_id, heartbeat_seconds):
+            result = handler(db, job, report)
+        job.status, job.result = STATUS_DONE, json.dumps(result)
+        print(f"[Jobs] Job {job.id} ({job.kind}) terminado: {result}")
+    except JobInterrupted:
+        db.rollback()
+        job = db.get(Job, job_id)
+        job.status, job.started_at, job.heartbeat_at = STATUS_QUEUED, None, None
+        # Un apagado ordenado no cuenta como intento fallido
+        job.attempts = max(0, (job.attempts or 1) - 1)
+        db.commit()
+        print(f"[Jobs] Job {job.id} ({job.kind}) interrumpido por apagado, queda encolado")
+        return job
+    except Exception as e:
+        db.rollback()
+        job = db.get(Job, job_id)
+        job.status, job.error = STATUS_FAILED, str(e)
+        print(f"[Jobs] Job {job.id} ({job.kind}) falló: {e}")
+    job.finished_at = _now()
+    db.commit()
+    inc("jobs_total", kind=job.kind, status=job.status)
+    observe("job_duration_seconds", time.perf_counter() - start, kind=job.kind)
+    return job
+
+
+def recover_stale_jobs(db: Session, lease_seconds: float = JOB_LEASE_SECONDS,
+                       max_attempts: int = JOB_MAX_ATTEMPTS) -> int:
+    """Vuelve a encolar los jobs `running` cuyo lease venció (su proceso murió).
+
+    Los que ya usaron `max_attempts` intentos se marcan fallidos, para no
+    reintentar para siempre un job que tira abajo el proceso.
+    """
+    cutoff = _lease_cutoff(lease_seconds)
+    stale = (Job.status == STATUS_RUNNING) & (func.coalesce(Job.heartbeat_at, Job.started_at, cutoff) <= cutoff)
+    failed = db.execute(
+        update(Job).where(stale, func.coalesce(Job.attempts, 0) >= max_attempts)
+        .values(status=STATUS_FAILED, finished_at=_now(),
+                error=f"El proceso dejó de responder en {max_attempts} intentos")
+    ).rowcount
+    requeued = db.execute(
+        update(Job).where(stale).values(status=STATUS_QUEUED, started_at=None, heartbeat_at=None)
+    ).rowcount
+    db.commit()
+    if failed or requeued:
+        print(f"[Jobs] Jobs sin heartbeat: {requeued} reencolados, {failed} marcados fallidos")
+    return requeued
+
+
+def requeue_job(db: Session, job_id: int, lease_seconds: float = JOB_LEASE_SECONDS) -> bool:
+    """Reintento manual: vuelve a encolar un job fallido o uno `running` con el lease vencido."""
+    cutoff = _lease_cutoff(lease_seconds)
+    retryable = (Job.status == STATUS_FAILED) | (
+        (Job.status == STATUS_RUNNING) & (func.coalesce(Job.heartbeat_at, Job.started_at, cutoff) <= cutoff)
+    )
+    result = db.execute(
+        update(Job).where(Job.id == job_id, retryable)
+        .values(status=STATUS_QUEUED, error=None, stage=None, processed=0, total=0, attempts=0,
+                started_at=None, heartbeat_at=None, finished_at=None)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+class JobQueue:
+    """Pool acotado de threads que ejecuta jobs de la tabla `jobs`.
+
+    Los threads son daemon y `shutdown()` avisa a los jobs en curso que se
+    corten en la próxima tanda, así apagar la API no espera a que termine un
+    reajuste completo. Lo que no llegue a cortarse queda con el heartbeat
+    viejo y se retoma en el próximo arranque.
+    """
+
+    def __init__(self, session_factory=None, max_workers: int = JOB_WORKERS, pause: float = JOB_PAUSE_SECONDS,
+                 heartbeat_seconds: float = JOB_HEARTBEAT_SECONDS, lease_seconds: float = JOB_LEASE_SECONDS):
+        self._session_factory = session_factory
+        self.max_workers = max_workers
+        self.pause = pause
+        self.heartbeat_seconds = heartbeat_seconds
+        self.lease_seconds = lease_seconds
+        self._queue: Optional["queue.Queue[int]"] = None
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._queue is not None
+
+    def session(self) -> Session:
+        if self._session_factory is None:
+            from app.db.database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def start(self) -> None:
+        """Arranca los workers, recupera jobs sin heartbeat y retoma los encolados."""
+        with self._lock:
+            if self._queue is not None:
+                return
+            self._stop = threading.Event()
+            self._queue = queue.Queue()
+            self._threads = [
+                threading.Thread(target=self._worker, args=(self._queue, self._stop), name=f"jobs-{i}", daemon=True)
+                for i in range(self.max_workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+        print(f"[Jobs] Cola iniciada con {self.max_workers} worker(s)")
+        try:
+            db = self.session()
+            try:
+                recover_stale_jobs(db, self.lease_seconds)
+                pending = [i for (i,) in db.query(Job.id).filter(Job.status == STATUS_QUEUED).order_by(Job.id)]
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"[Jobs] No se pudieron leer jobs pendientes: {e}")
+            return
+        for job_id in pending:
+            self.submit(job_id)
+        if pending:
+            print(f"[Jobs] {len(pending)} job(s) pendientes retomados")
+
+    def shutdown(self, wait: bool = False, timeout: Optional[float] = None) -> None:
+        """Frena los workers; con `wait` espera (hasta `timeout`) a que corten el job actual."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+            self._queue = None
+            self._stop.set()
+        if wait:
+            for thread in threads:
+                thread.join(timeout)
+
+    def submit(self, job_id: int) -> bool:
+        pending = self._queue
+        if pending is None:
+            return False
+        pending.put(job_id)
+        return True
+
+    def _worker(self, pending: "queue.Queue[int]", stop: threading.Event) -> None:
+        while not stop.is_set():
+            try:
+                job_id = pending.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if not stop.is_set():
+                self._run(job_id, stop)
+
+    def _run(self, job_id: int, stop: threading.Event) -> None:
+        db = self.session()
+        try:
+            execute_job(db, job_id, pause=self.pause, stop=stop, heartbeat_seconds=self.heartbeat_seconds)
+        except Exception as e:
+            print(f"[Jobs] Error ejecutando job {job_id}: {e}")
+        finally:
+            db.close()
+
+
+job_queue = JobQueue()
+
+
+def enqueue_job(db: Session, kind: str, payload: Optional[Dict[str, Any]] = None,
+                queue: Optional[JobQueue] = None) -> Job:
+    """Guarda el job y, si la cola está corriendo en este proceso, lo manda a ejecutar."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Tipo de job desconocido: {kind}")
+    job = Job(kind=kind, status=STATUS_QUEUED, payload=json.dumps(payload) if payload is not None else None,
+              processed=0, total=0, created_at=_now())
+    db.add(job)
+    db.commit()
+    inc("jobs_total", kind=kind, status=STATUS_QUEUED)
+    (queue or job_queue).submit(job.id)
+    return job
+
+
+def enqueue_refresh(db: Session, review_ids: Optional[List[int]] = None,
+                    queue: Optional[JobQueue] = None) -> Job:
+    """Encola el refresco de `review_ids` (o de todo lo que esté incompleto si es None)."""
+    payload = {"review_ids": list(review_ids)} if review_ids is not None else {}
+    job = enqueue_job(db, KIND_REFRESH, payload, queue=queue)
+    print(f"[Jobs] Job {job.id} encolado: refresco de "
+          f"{len(review_ids) if review_ids is not None else 'todas las'} reseñas")
+    return job
+
+
+def run_pending(db: Session, pause: float = 0.0) -> int:
+    """Ejecuta en este proceso, en orden, todos los jobs encolados. Devuelve cuántos corrió.
+
+    Incluye los que encolen los propios jobs (p. ej. el reajuste de tópicos
+    que pide un refresco cuando no hay centroides).
+    """
+    recover_stale_jobs(db)
+    ran = 0
+    last_id = 0
+    while True:
+        next_job = db.query(Job.id).filter(Job.status == STATUS_QUEUED, Job.id > last_id).order_by(Job.id).first()
+        if next_job is None:
+            return ran
+        last_id = next_job[0]
+        if execute_job(db, last_id, pause=pause) is not None:
+            ran += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ejecuta los jobs encolados (sin levantar la API)")
+    parser.add_argument("--refresh", action="store_true", help="Encolar antes un refresco de las reseñas incompletas")
+    args = parser.parse_args()
+
+    from app.db.database import get_db
+    db = next(get_db())
+    if args.refresh:
+        enqueue_refresh(db)
+    ran = run_pending(db)
+    print(f"[Jobs] {ran} job(s) ejecutados")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,27 @@
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional
+
 import folium
+import h3
 import pandas as pd
+from folium.plugins import FastMarkerCluster
+from sqlalchemy import func
 from app.models.review import Review
 from sqlalchemy.orm import Session
 from app.db.database import get_db
+from app.services.metrics import span, inc
+from app.services.topic_model import H3_RESOLUTION
+
+MAP_CACHE_DIR = "data/map_cache"
+MAP_CACHE_MAX_FILES = 200
+POPUP_TEXT_CHARS = 200
+POPUP_REVIEWS = 3
+COORD_DECIMALS = 5
 
 # Función para crear un mapa con reseñas
 
@@ -17,8 +36,224 @@ def create_reviews_map(db: Session, center_lat=-34.6037, center_lon=-58.3816, zo
         ).add_to(m)
     return m
 
+
+# Mapa agrupado: un punto por lugar, cluster en el cliente y detalle bajo demanda
+
+_MARKER_CALLBACK = """
+var callback = function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {title: row[2]});
+    var header = document.createElement('div');
+    var title = document.createElement('b');
+    title.textContent = row[2];
+    header.appendChild(title);
+    header.appendChild(document.createElement('br'));
+    header.appendChild(document.createTextNode('Rating: ' + row[3] + ' (' + row[4] + ' reseñas)'));
+    var details = document.createElement('div');
+    details.textContent = 'Cargando...';
+    var content = document.createElement('div');
+    content.appendChild(header);
+    content.appendChild(details);
+    marker.bindPopup(content, {maxWidth: 300});
+    marker.on('popupopen', function () {
+        if (details.dataset.loaded) { return; }
+        fetch('%(details_url)s' + encodeURIComponent(row[5]))
+            .then(function (r) { return r.json(); })
+            .then(function (place) {
+                details.dataset.loaded = '1';
+                details.textContent = '';
+                if (place.topics && place.topics.length) {
+                    var topic = document.createElement('i');
+                    topic.textContent = place.topics[0];
+                    details.appendChild(topic);
+                }
+                (place.reviews || []).forEach(function (rv) {
+                    var p = document.createElement('p');
+                    p.textContent = (rv.rating ? rv.rating + '★ ' : '') + rv.text;
+                    details.appendChild(p);
+                });
+            })
+            .catch(function () { details.textContent = 'No se pudo cargar el detalle'; });
+    });
+    return marker;
+};
+"""
+
+
+def _filtered_query(db: Session, columns, topic: Optional[str] = None, neighborhood: Optional[str] = None):
+    query = db.query(*columns).filter(Review.lat.isnot(None), Review.lon.isnot(None))
+    if topic:
+        query = query.filter(Review.topic == topic)
+    if neighborhood and neighborhood != "Todos":
+        query = query.filter(Review.name.ilike(f"%{neighborhood}%"))
+    return query
+
+
+def aggregate_places(db: Session, topic: Optional[str] = None, neighborhood: Optional[str] = None) -> List[Dict]:
+    """Agrupa las reseñas por place_id (un punto por lugar) con rating promedio y su celda H3."""
+    columns = (
+        Review.place_id,
+        func.min(Review.name),
+        func.avg(Review.lat),
+        func.avg(Review.lon),
+        func.avg(Review.rating),
+        func.count(Review.id),
+        func.min(Review.h3_index),
+    )
+    with span("map.aggregate_places"):
+        rows = _filtered_query(db, columns, topic, neighborhood).group_by(Review.place_id).all()
+    inc("rows_scanned_total", len(rows), op="map_places")
+
+    places = []
+    for place_id, name, lat, lon, rating, count, h3_index in rows:
+        lat, lon = float(lat), float(lon)
+        places.append({
+            "place_id": place_id,
+            "name": name or "",
+            "lat": round(lat, COORD_DECIMALS),
+            "lon": round(lon, COORD_DECIMALS),
+            "rating": round(float(rating), 1) if rating is not None else None,
+            "n_reviews": int(count),
+            "h3_index": h3_index or h3.geo_to_h3(lat, lon, H3_RESOLUTION),
+        })
+    return places
+
+
+def create_clustered_map(db: Session, topic: Optional[str] = None, neighborhood: Optional[str] = None,
+                         details_url: str = "/maps/place/", center_lat=-34.6037, center_lon=-58.3816,
+                         zoom_start=12):
+    """Mapa liviano para muchos datos.
+
+    En lugar de un Marker por reseña con todo el texto en el popup, manda al
+    navegador un array compacto con un punto por lugar que se agrupa del lado
+    del cliente (FastMarkerCluster). El texto de las reseñas se pide recién al
+    abrir el popup a `details_url + place_id`. Una capa opcional muestra la
+    cantidad de reseñas por celda H3.
+    """
+    places = aggregate_places(db, topic, neighborhood)
+    m = folium.Map(location=[center_lat, center_lon], zoom_start=zoom_start)
+
+    with span("map.render"):
+        data = [[p["lat"], p["lon"], p["name"], p["rating"], p["n_reviews"], p["place_id"]] for p in places]
+        FastMarkerCluster(
+            data,
+            callback=_MARKER_CALLBACK % {"details_url": details_url},
+            name="Lugares",
+        ).add_to(m)
+
+        cells: Dict[str, int] = {}
+        for p in places:
+            cells[p["h3_index"]] = cells.get(p["h3_index"], 0) + p["n_reviews"]
+        features = [{
+            "type": "Feature",
+            "properties": {"h3_index": cell, "reviews": count},
+            "geometry": {"type": "Polygon", "coordinates": [h3.h3_to_geo_boundary(cell, geo_json=True)]},
+        } for cell, count in cells.items()]
+        if features:
+            folium.GeoJson(
+                {"type": "FeatureCollection", "features": features},
+                name="Celdas H3",
+                show=False,
+                style_function=lambda _: {"color": "#2563eb", "weight": 1, "fillOpacity": 0.15},
+                tooltip=folium.GeoJsonTooltip(fields=["reviews"], aliases=["Reseñas"]),
+            ).add_to(m)
+        folium.LayerControl().add_to(m)
+    return m
+
+
+def place_details(db: Session, place_id: str, n_reviews: int = POPUP_REVIEWS,
+                  max_chars: int = POPUP_TEXT_CHARS) -> Optional[Dict]:
+    """Detalle de un lugar para el popup: reseñas recientes con el texto truncado."""
+    reviews = (
+        db.query(Review.name, Review.rating, Review.text, Review.topic)
+        .filter(Review.place_id == place_id)
+        .order_by(Review.created_at.desc(), Review.id.desc())
+        .all()
+    )
+    if not reviews:
+        return None
+    ratings = [r.rating for r in reviews if r.rating is not None]
+    topics = [t for t, _ in Counter(r.topic for r in reviews if r.topic).most_common(3)]
+    return {
+        "place_id": place_id,
+        "name": reviews[0].name,
+        "rating": round(sum(ratings) / len(ratings), 1) if ratings else None,
+        "n_reviews": len(reviews),
+        "topics": topics,
+        "reviews": [{
+            "rating": r.rating,
+            "text": (r.text[:max_chars] + "…") if r.text and len(r.text) > max_chars else (r.text or ""),
+        } for r in reviews[:n_reviews]],
+    }
+
+
+def data_version(db: Session) -> str:
+    """Huella barata de los datos que entran en el HTML del mapa (una sola pasada agregada).
+
+    Cambia al insertar/borrar reseñas, al recalcular tópicos/H3 y al editar en
+    el lugar rating, lat/lon o nombre (sumas y largos de esas columnas). El
+    texto no está en el HTML: el popup lo pide a /maps/place/{id}. Límite
+    conocido: renombrar un lugar con otro nombre del mismo largo, o cambios
+    que se compensen en la suma, no invalidan el cache.
+    """
+    count, max_id, with_topic, with_h3, ratings, lats, lons, name_chars = db.query(
+        func.count(Review.id), func.max(Review.id), func.count(Review.topic), func.count(Review.h3_index),
+        func.sum(Review.rating), func.sum(Review.lat), func.sum(Review.lon), func.sum(func.length(Review.name)),
+    ).one()
+    topics = sorted(t for (t,) in db.query(Review.topic).distinct() if t)
+    topics_crc = zlib.crc32("\n".join(topics).encode("utf-8"))
+    sums = f"{float(ratings or 0):.6f}|{float(lats or 0):.9f}|{float(lons or 0):.9f}|{name_chars or 0}"
+    sums_crc = zlib.crc32(sums.encode("utf-8"))
+    return f"{count}-{max_id}-{with_topic}-{with_h3}-{topics_crc:08x}-{sums_crc:08x}"
+
+
+def _cache_path(topic: Optional[str], neighborhood: Optional[str], version: str, cache_dir: str) -> str:
+    key = json.dumps([topic or "", neighborhood or "", version], ensure_ascii=False)
+    return os.path.join(cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".html")
+
+
+def _prune_cache(cache_dir: str, max_files: int) -> None:
+    files = [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith(".html")]
+    if len(files) <= max_files:
+        return
+    files.sort(key=os.path.getmtime)
+    for path in files[:len(files) - max_files]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def get_clustered_map_html(db: Session, topic: Optional[str] = None, neighborhood: Optional[str] = None,
+                           cache_dir: str = MAP_CACHE_DIR, max_files: int = MAP_CACHE_MAX_FILES) -> str:
+    """HTML del mapa agrupado, cacheado en disco por (tópico, barrio, versión de datos)."""
+    if neighborhood == "Todos":
+        neighborhood = None
+    with span("map.data_version"):
+        version = data_version(db)
+    path = _cache_path(topic, neighborhood, version, cache_dir)
+    if os.path.exists(path):
+        inc("map_cache_total", result="hit")
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    inc("map_cache_total", result="miss")
+    html = create_clustered_map(db, topic=topic, neighborhood=neighborhood).get_root().render()
+    os.makedirs(cache_dir, exist_ok=True)
+    # Temporal único por llamada: /maps/html corre en el threadpool y dos misses simultáneos comparten pid
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(html)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _prune_cache(cache_dir, max_files)
+    return html
+
 # Guardar el mapa como HTML
 
-def save_map_html(db: Session, filepath="data/reviews_map.html"):
-    m = create_reviews_map(db)
+def save_map_html(db: Session, filepath="data/reviews_map.html", clustered: bool = True):
+    m = create_clustered_map(db) if clustered else create_reviews_map(db)
     m.save(filepath)
@@ -0,0 +1,329 @@
+"""Métricas livianas en proceso: spans de latencia, histogramas y contadores.
+
+Uso típico:
+
+    with span("search.encode_query"):
+        model.encode(...)
+
+    @timed("scrape.fetch")
+    def fetch(...): ...
+
+    inc("rows_scanned_total", len(rows), op="search")
+    observe("encode_batch_size", len(batch))
+
+Todo se agrega en un registro global que `render_prometheus()` expone en el
+formato de texto de Prometheus (ver GET /metrics). Si un request pidió
+profiling (header X-Profile), los spans también se acumulan en una lista por
+request que el middleware devuelve en la respuesta.
+
+El registro es por proceso. Con varios workers (`uvicorn --workers N`) hay que
+definir `METRICS_DIR`: cada proceso vuelca su registro en `<pid>.json` dentro
+de ese directorio cada `METRICS_FLUSH_SECONDS`, y GET /metrics suma los
+archivos de todos los procesos. Los archivos de procesos muertos se siguen
+sumando para que los contadores no bajen; el directorio se vacía antes de
+levantar los workers (ver `make run_workers`).
+"""
+import atexit
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_SECONDS = 5
+
+STAGE_HISTOGRAM = "stage_duration_seconds"
+
+_HELP = {
+    STAGE_HISTOGRAM: "Duración de cada etapa instrumentada con span()",
+    "http_request_duration_seconds": "Duración de los requests HTTP por ruta",
+    "http_requests_total": "Requests HTTP por ruta, método y status",
+    "rows_scanned_total": "Filas leídas de la base por operación",
+    "vectors_scored_total": "Vectores comparados contra la consulta por operación",
+    "encode_batch_size": "Tamaño de los batches enviados al encoder",
+    "serpapi_calls_total": "Llamadas a SerpAPI por endpoint y status",
+    "serpapi_retries_total": "Reintentos hechos por urllib3 en llamadas a SerpAPI",
+    "scraped_reviews_total": "Reseñas procesadas por el scraper según resultado",
+    "jobs_total": "Jobs en segundo plano por tipo y estado (queued al encolar, done/failed al terminar)",
+    "job_duration_seconds": "Duración de los jobs en segundo plano por tipo",
+    "map_cache_total": "Pedidos de mapa HTML servidos desde el cache en disco (hit) o renderizados (miss)",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Spans del request actual (solo si el request pidió profiling)
+_request_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_spans", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+
+class Registry:
+    """Registro thread-safe de contadores e histogramas con labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, buckets: Optional[Sequence[float]] = None, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            bounds = self._buckets.setdefault(name, buckets or LATENCY_BUCKETS)
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(bounds)
+            hist.observe(value)
+
+    def dump(self) -> Dict[str, Any]:
+        """Copia serializable a JSON del registro (para `METRICS_DIR`)."""
+        with self._lock:
+            return {
+                "counters": {
+                    name: [[list(key), value] for key, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "histograms": {
+                    name: [[list(key), list(hist.buckets), list(hist.counts), hist.total, hist.sum]
+                           for key, hist in series.items()]
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def merge(self, data: Dict[str, Any]) -> None:
+        """Suma al registro un volcado de `dump()` de otro proceso."""
+        with self._lock:
+            for name, series in data.get("counters", {}).items():
+                target = self._counters.setdefault(name, {})
+                for key, value in series:
+                    key = tuple(tuple(pair) for pair in key)
+                    target[key] = target.get(key, 0.0) + value
+            for name, series in data.get("histograms", {}).items():
+                target = self._histograms.setdefault(name, {})
+                for key, buckets, counts, total, total_sum in series:
+                    key = tuple(tuple(pair) for pair in key)
+                    hist = target.get(key)
+                    if hist is None:
+                        hist = target[key] = Histogram(buckets)
+                        self._buckets.setdefault(name, hist.buckets)
+                    if hist.buckets != tuple(buckets):
+                        continue
+                    hist.counts = [a + b for a, b in zip(hist.counts, counts)]
+                    hist.total += total
+                    hist.sum += total_sum
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._buckets.clear()
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            for name in sorted(self._histograms):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {hist.total}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(hist.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {hist.total}")
+        return "\n".join(lines) + "\n"
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REGISTRY = Registry()
+
+# Proceso que ya arrancó su thread de volcado a METRICS_DIR
+_dump_pid: Optional[int] = None
+_dump_lock = threading.Lock()
+
+
+def _dump_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+def write_process_dump() -> None:
+    """Vuelca el registro de este proceso a METRICS_DIR (reemplazo atómico)."""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(REGISTRY.dump(), f)
+        os.replace(tmp_path, _dump_path(os.getpid()))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _dump_loop() -> None:
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            write_process_dump()
+        except Exception as e:
+            print(f"[Metrics] Error volcando métricas en {METRICS_DIR}: {e}")
+
+
+def _ensure_process_dump() -> None:
+    """Arranca (una vez por proceso) el volcado periódico si hay METRICS_DIR."""
+    global _dump_pid
+    if not METRICS_DIR or _dump_pid == os.getpid():
+        return
+    with _dump_lock:
+        if _dump_pid == os.getpid():
+            return
+        _dump_pid = os.getpid()
+        threading.Thread(target=_dump_loop, name="metrics-dump", daemon=True).start()
+        atexit.register(write_process_dump)
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    """Incrementa un contador."""
+    _ensure_process_dump()
+    REGISTRY.inc(name, value, **labels)
+
+
+def observe(name: str, value: float, buckets: Optional[Sequence[float]] = None, **labels) -> None:
+    """Registra un valor en un histograma (por defecto con buckets de latencia)."""
+    _ensure_process_dump()
+    REGISTRY.observe(name, value, buckets=buckets, **labels)
+
+
+def _record_span(name: str, elapsed: float) -> None:
+    _ensure_process_dump()
+    REGISTRY.observe(STAGE_HISTOGRAM, elapsed, stage=name)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((name, elapsed))
+
+
+@contextmanager
+def span(name: str):
+    """Mide la duración del bloque y la registra como etapa `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_span(name, time.perf_counter() - start)
+
+
+class SpanTotal:
+    """Suma el tiempo de varias pasadas por la misma etapa (p. ej. una por batch).
+
+        decode = SpanTotal("search.decode_embeddings")
+        for batch in batches:
+            with decode:
+                ...
+        decode.record()
+
+    Se registra una sola observación con el total, igual que un `span()` que
+    envolviera todas las pasadas.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.elapsed = 0.0
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed += time.perf_counter() - self._start
+        return False
+
+    def record(self) -> None:
+        _record_span(self.name, self.elapsed)
+
+
+def timed(name: str):
+    """Decorador equivalente a envolver la función entera en `span(name)`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_request_profile() -> List[Tuple[str, float]]:
+    """Activa la captura de spans para el request actual y devuelve la lista."""
+    spans: List[Tuple[str, float]] = []
+    _request_spans.set(spans)
+    return spans
+
+
+def render_prometheus() -> str:
+    """Métricas de este proceso, o la suma de todos los procesos si hay METRICS_DIR."""
+    if not METRICS_DIR:
+        return REGISTRY.render()
+    write_process_dump()
+    merged = Registry()
+    for filename in sorted(os.listdir(METRICS_DIR)):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, filename)) as f:
+                merged.merge(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"[Metrics] Se ignora {filename}: {e}")
+    return merged.render()
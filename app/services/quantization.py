@@ -0,0 +1,211 @@
+"""Cuantización de embeddings para un tier de búsqueda con poca memoria.
+
+Dos codificaciones, entrenadas sobre los embeddings guardados (normalizados):
+
+    ProductQuantizer   divide cada vector en `n_subvectors` partes y guarda,
+                       por parte, el índice (uint8) del centroide más cercano
+                       de un KMeans de 256 centroides. 384 dims con 48
+                       subvectores ocupan 48 bytes en lugar de 1536.
+    ScalarQuantizer    int8 por dimensión (min/max por dimensión), 384 bytes.
+
+La búsqueda es asimétrica: la consulta queda en float32 y se compara contra
+los códigos con tablas de lookup (PQ) o un producto punto reescalado (int8).
+Después se re-rankea con los vectores exactos solo una lista corta de
+candidatos (`shortlist`), que en modo snapshot se leen del memmap.
+"""
+import os
+from typing import Optional
+
+import numpy as np
+from sklearn.cluster import KMeans
+
+from app.services.metrics import span
+
+DEFAULT_SUBVECTORS = 48
+N_CENTROIDS = 256
+TRAIN_SIZE = 50_000
+SCORE_CHUNK = 65_536
+RERANK_SHORTLIST = 200
+
+QUANTIZER_FILE = "quantizer.npz"
+CODES_FILE = "codes.npy"
+
+
+class ProductQuantizer:
+    kind = "pq"
+
+    def __init__(self, n_subvectors: int = DEFAULT_SUBVECTORS, n_centroids: int = N_CENTROIDS):
+        if n_centroids > 256:
+            raise ValueError("n_centroids debe ser <= 256 para usar códigos uint8")
+        self.n_subvectors = n_subvectors
+        self.n_centroids = n_centroids
+        self.codebooks: Optional[np.ndarray] = None  # (m, k, dsub)
+
+    @property
+    def dim(self) -> int:
+        return self.codebooks.shape[0] * self.codebooks.shape[2]
+
+    def check_dim(self, dim: int) -> None:
+        """Falla si los vectores de dimensión `dim` no se pueden partir en `n_subvectors`."""
+        if self.n_subvectors <= 0 or dim % self.n_subvectors:
+            raise ValueError(f"La dimensión {dim} no es divisible por n_subvectors={self.n_subvectors}")
+
+    def fit(self, vectors: np.ndarray, train_size: int = TRAIN_SIZE, seed: int = 42) -> "ProductQuantizer":
+        n, dim = vectors.shape
+        self.check_dim(dim)
+        rng = np.random.default_rng(seed)
+        sample = vectors[np.sort(rng.choice(n, size=min(n, train_size), replace=False))]
+        sample = np.asarray(sample, dtype=np.float32)
+        k = min(self.n_centroids, len(sample))
+        dsub = dim // self.n_subvectors
+        codebooks = np.zeros((self.n_subvectors, self.n_centroids, dsub), dtype=np.float32)
+        with span("quantization.pq_fit"):
+            for j in range(self.n_subvectors):
+                sub = sample[:, j * dsub:(j + 1) * dsub]
+                km = KMeans(n_clusters=k, n_init=1, max_iter=25, random_state=seed).fit(sub)
+                codebooks[j, :k] = km.cluster_centers_
+        self.codebooks = codebooks
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        m, k, dsub = self.codebooks.shape
+        codes = np.empty((len(vectors), m), dtype=np.uint8)
+        for start in range(0, len(vectors), SCORE_CHUNK):
+            chunk = np.asarray(vectors[start:start + SCORE_CHUNK], dtype=np.float32)
+            for j in range(m):
+                sub = chunk[:, j * dsub:(j + 1) * dsub]
+                # argmin ||x - c||^2 = argmin (||c||^2 - 2 x·c)
+                dist = (self.codebooks[j] ** 2).sum(axis=1) - 2.0 * sub @ self.codebooks[j].T
+                codes[start:start + len(chunk), j] = dist.argmin(axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        m = self.codebooks.shape[0]
+        return np.concatenate([self.codebooks[j][codes[:, j]] for j in range(m)], axis=1)
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Producto punto aproximado entre `query` y cada vector codificado (ADC)."""
+        m, k, dsub = self.codebooks.shape
+        tables = np.einsum("jkd,jd->jk", self.codebooks, query.reshape(m, dsub).astype(np.float32))
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK):
+            chunk = np.asarray(codes[start:start + SCORE_CHUNK])
+            acc = np.zeros(len(chunk), dtype=np.float32)
+            for j in range(m):
+                acc += tables[j][chunk[:, j]]
+            scores[start:start + len(chunk)] = acc
+        return scores
+
+    def bytes_per_vector(self) -> int:
+        return self.codebooks.shape[0]
+
+    def to_arrays(self) -> dict:
+        return {"kind": np.array(self.kind), "codebooks": self.codebooks}
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "ProductQuantizer":
+        codebooks = arrays["codebooks"]
+        pq = cls(n_subvectors=codebooks.shape[0], n_centroids=codebooks.shape[1])
+        pq.codebooks = codebooks
+        return pq
+
+
+class ScalarQuantizer:
+    kind = "int8"
+
+    def __init__(self):
+        self.offset: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+
+    @property
+    def dim(self) -> int:
+        return len(self.offset)
+
+    def check_dim(self, dim: int) -> None:
+        """Cualquier dimensión sirve (un byte por dimensión)."""
+
+    def fit(self, vectors: np.ndarray, train_size: int = TRAIN_SIZE, seed: int = 42) -> "ScalarQuantizer":
+        rng = np.random.default_rng(seed)
+        n = len(vectors)
+        sample = np.asarray(vectors[np.sort(rng.choice(n, size=min(n, train_size), replace=False))], dtype=np.float32)
+        lo, hi = sample.min(axis=0), sample.max(axis=0)
+        self.offset = lo
+        self.scale = np.where(hi > lo, (hi - lo) / 255.0, 1.0).astype(np.float32)
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty(vectors.shape, dtype=np.uint8)
+        for start in range(0, len(vectors), SCORE_CHUNK):
+            chunk = np.asarray(vectors[start:start + SCORE_CHUNK], dtype=np.float32)
+            codes[start:start + len(chunk)] = np.clip(np.rint((chunk - self.offset) / self.scale), 0, 255)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * self.scale + self.offset
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        q = query.astype(np.float32)
+        qs = q * self.scale
+        bias = float(q @ self.offset)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK):
+            chunk = np.asarray(codes[start:start + SCORE_CHUNK], dtype=np.float32)
+            scores[start:start + len(chunk)] = chunk @ qs + bias
+        return scores
+
+    def bytes_per_vector(self) -> int:
+        return len(self.offset)
+
+    def to_arrays(self) -> dict:
+        return {"kind": np.array(self.kind), "offset": self.offset, "scale": self.scale}
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "ScalarQuantizer":
+        sq = cls()
+        sq.offset = arrays["offset"]
+        sq.scale = arrays["scale"]
+        return sq
+
+
+QUANTIZERS = {"pq": ProductQuantizer, "int8": ScalarQuantizer}
+
+
+def make_quantizer(kind: str, n_subvectors: int = DEFAULT_SUBVECTORS):
+    if kind == "pq":
+        return ProductQuantizer(n_subvectors=n_subvectors)
+    if kind == "int8":
+        return ScalarQuantizer()
+    raise ValueError(f"Cuantizador desconocido: {kind}")
+
+
+def save_quantizer(directory: str, quantizer, codes: np.ndarray) -> None:
+    np.savez(os.path.join(directory, QUANTIZER_FILE), **quantizer.to_arrays())
+    np.save(os.path.join(directory, CODES_FILE), codes)
+
+
+def load_quantizer(directory: str):
+    """Devuelve (quantizer, codes mmap) si el directorio tiene códigos, si no (None, None)."""
+    path = os.path.join(directory, QUANTIZER_FILE)
+    if not os.path.exists(path):
+        return None, None
+    with np.load(path) as arrays:
+        kind = str(arrays["kind"])
+        quantizer = QUANTIZERS[kind].from_arrays({k: arrays[k] for k in arrays.files})
+    codes = np.load(os.path.join(directory, CODES_FILE), mmap_mode="r")
+    return quantizer, codes
+
+
+def shortlist_rerank(quantizer, codes: np.ndarray, vectors: np.ndarray, rows: np.ndarray,
+                     query: np.ndarray, shortlist: int = RERANK_SHORTLIST):
+    """Filtra `rows` con puntajes aproximados y re-rankea los mejores con vectores exactos.
+
+    Devuelve (rows, similitudes exactas) de los `shortlist` candidatos, sin ordenar.
+    """
+    with span("quantization.approx_scoring"):
+        approx = quantizer.score(codes[rows], query)
+    if len(rows) > shortlist:
+        keep = np.argpartition(-approx, shortlist - 1)[:shortlist]
+        rows = rows[np.sort(keep)]
+    with span("quantization.rerank"):
+        exact = np.asarray(vectors[rows], dtype=np.float32) @ query.astype(np.float32)
+    return rows, exact
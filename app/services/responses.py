@@ -0,0 +1,215 @@
+"""Capa de respuestas compactas para la API.
+
+- `fields=` proyecta solo las columnas pedidas (`fields=name,lat,lon`).
+- `text_chars=` trunca el texto de las reseñas.
+- `format=columns` devuelve arrays paralelos en lugar de una lista de dicts:
+  `{"count": 2, "columns": {"name": ["A", "B"], "lat": [..], ...}}`.
+- Serialización con orjson si está instalado (JSON estándar si no).
+- `CompressionMiddleware` comprime con brotli o gzip según Accept-Encoding,
+  solo por encima de un tamaño mínimo y sin bufferear respuestas en streaming.
+"""
+import json
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson es opcional
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli es opcional
+    brotli = None
+
+FORMAT_PATTERN = "^(rows|columns)$"
+TEXT_FIELD = "text"
+COMPRESSION_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+if orjson is not None:
+    class FastJSONResponse(JSONResponse):
+        """JSONResponse serializada con orjson (también acepta tipos numpy)."""
+
+        def render(self, content: Any) -> bytes:
+            return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+else:
+    class FastJSONResponse(JSONResponse):
+        def render(self, content: Any) -> bytes:
+            return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(content: Any) -> bytes:
+    """Serializa igual que FastJSONResponse (para escribir archivos o medir)."""
+    return FastJSONResponse(None).render(content)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    parsed = [f.strip() for f in fields.split(",") if f.strip()]
+    return parsed or None
+
+
+def _truncate(text: Optional[str], text_chars: Optional[int]) -> Optional[str]:
+    if text is None or text_chars is None or len(text) <= text_chars:
+        return text
+    return text[:text_chars] + "…"
+
+
+def project_rows(rows: Iterable[Dict[str, Any]], fields: Optional[List[str]] = None,
+                 text_chars: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Deja solo `fields` (si se pidieron) y trunca `text` a `text_chars`."""
+    result = []
+    for row in rows:
+        if fields is not None:
+            row = {f: row.get(f) for f in fields if f in row}
+        if text_chars is not None and row.get(TEXT_FIELD) is not None:
+            row = dict(row)
+            row[TEXT_FIELD] = _truncate(row[TEXT_FIELD], text_chars)
+        result.append(row)
+    return result
+
+
+def to_columns(rows: List[Dict[str, Any]], fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Lista de dicts -> arrays paralelos (las claves del primer row definen las columnas)."""
+    if fields is None:
+        fields = list(rows[0].keys()) if rows else []
+    return {
+        "count": len(rows),
+        "columns": {f: [row.get(f) for row in rows] for f in fields},
+    }
+
+
+def shape_rows(rows: List[Dict[str, Any]], fields: Optional[str] = None, text_chars: Optional[int] = None,
+               fmt: str = "rows") -> Any:
+    """Aplica proyección, truncado y formato; devuelve el contenido listo para serializar."""
+    field_list = parse_fields(fields)
+    rows = project_rows(rows, field_list, text_chars)
+    if fmt == "columns":
+        return to_columns(rows, field_list)
+    return rows
+
+
+def shaped_response(rows: List[Dict[str, Any]], fields: Optional[str] = None, text_chars: Optional[int] = None,
+                    fmt: str = "rows") -> FastJSONResponse:
+    return FastJSONResponse(shape_rows(rows, fields=fields, text_chars=text_chars, fmt=fmt))
+
+
+def _accepted_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(token.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    """Compresor incremental con la misma interfaz para gzip y brotli."""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=brotli_quality)
+            self._process, self._flush, self._finish = self._obj.process, self._obj.flush, self._obj.finish
+        else:
+            # wbits=31: formato gzip (header + trailer) en lugar de zlib crudo
+            self._obj = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self._process = self._obj.compress
+            self._flush = lambda: self._obj.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._obj.flush
+
+    def chunk(self, data: bytes) -> bytes:
+        """Comprime un chunk intermedio y lo deja decodificable hasta acá (para streaming)."""
+        return self._process(data) + self._flush()
+
+    def last(self, data: bytes) -> bytes:
+        return self._process(data) + self._finish()
+
+
+class CompressionMiddleware:
+    """Middleware ASGI que comprime respuestas con brotli (si está instalado) o gzip.
+
+    Decide en `http.response.start`: respuestas ya comprimidas o de tipos no
+    comprimibles pasan sin tocar ni bufferear. Si el body llega en un solo
+    mensaje se comprime solo si supera `minimum_size`; las respuestas en
+    streaming se comprimen chunk por chunk sin juntarlas.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, gzip_level: int = GZIP_LEVEL,
+                 brotli_quality: int = BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = _accepted_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_length = headers.get("content-length")
+                passthrough = (
+                    "content-encoding" in headers
+                    or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                    or (content_length is not None and int(content_length) < self.minimum_size)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                if not more_body and len(body) < self.minimum_size:
+                    # Respuesta completa y chica: sale tal cual
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    # Streaming: el largo final no se conoce
+                    del headers["Content-Length"]
+                else:
+                    body = compressor.last(body)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start_message)
+
+            data = compressor.chunk(body) if more_body else compressor.last(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
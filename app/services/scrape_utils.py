@@ -1,25 +1,37 @@
+from sqlalchemy import inspect
 from app.models.review import Review
 from app.db.database import get_db
 from app.services.serpapi_client import get_reviews_google_maps
 from app.services.export_reviews import export_reviews_json
+from app.services.metrics import span, inc
+from app.services.jobs import enqueue_refresh
 
-def scrape_and_save_reviews(db, query="pub", location="Buenos Aires", num: int = 50):
+def scrape_and_save_reviews(db, query="pub", location="Buenos Aires", num: int = 50, enqueue: bool = True):
+    """Scrapea y guarda reseñas nuevas.
+
+    Con `enqueue` encola un job que calcula embeddings, tópico y H3 solo para
+    las reseñas insertadas (ver app/services/jobs.py).
+    """
     print(f"[Scraping] Iniciando scraping con num={num}")
-    reviews = get_reviews_google_maps(query, location, num)
+    with span("scrape.fetch"):
+        reviews = get_reviews_google_maps(query, location, num)
     scraped = 0
+    saved = []
     for r in reviews:
         try:
             place_id = r.get("place_id")
             text = r.get("text")
 
             # Deduplicar por place_id + texto (si existe exactamente igual)
-            exists = db.query(Review).filter(
-                Review.place_id == place_id,
-                Review.text == text
-            ).first() if place_id else None
+            with span("scrape.dedup_check"):
+                exists = db.query(Review).filter(
+                    Review.place_id == place_id,
+                    Review.text == text
+                ).first() if place_id else None
 
             if exists:
                 print(f"[Scraping] Saltando reseña duplicada para place_id={place_id}")
+                inc("scraped_reviews_total", result="duplicate")
                 continue
 
             review_obj = Review(
@@ -32,16 +44,26 @@ def scrape_and_save_reviews(db, query="pub", location="Buenos Aires", num: int =
                 source=r.get("source"),
             )
             db.add(review_obj)
+            saved.append(review_obj)
             scraped += 1
+            inc("scraped_reviews_total", result="saved")
             if scraped % 5 == 0:
-                db.commit()  
+                with span("scrape.db_commit"):
+                    db.commit()
                 print(f"[Scraping] {scraped} reseñas guardadas...")
         except Exception as e:
             print(f"[Scraping] Error guardando reseña: {e}")
+            inc("scraped_reviews_total", result="error")
             db.rollback()
             continue
-    db.commit()
-    export_reviews_json(db)
+    with span("scrape.db_commit"):
+        db.commit()
+    with span("scrape.export_json"):
+        export_reviews_json(db)
+    # Las que se perdieron en un rollback ya no están persistidas
+    new_ids = [state.identity[0] for state in map(inspect, saved) if state.persistent]
+    if enqueue and new_ids:
+        enqueue_refresh(db, new_ids)
     print(f"[Scraping] Proceso finalizado. Total: {scraped}")
     return scraped
 
@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from typing import List, Dict, Any
+from app.services.metrics import span, inc
 
 load_dotenv()
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")
@@ -33,6 +34,21 @@ def _build_session(retries: int = 3, backoff: float = 1.0) -> requests.Session:
     return session
 
 
+def _search(session: requests.Session, params: Dict[str, Any], endpoint: str) -> requests.Response:
+    """GET a SerpApi registrando latencia, status y reintentos de urllib3."""
+    try:
+        with span(f"serpapi.{endpoint}"):
+            resp = session.get("https://serpapi.com/search", params=params, timeout=10)
+    except Exception:
+        inc("serpapi_calls_total", endpoint=endpoint, status="error")
+        raise
+    inc("serpapi_calls_total", endpoint=endpoint, status=resp.status_code)
+    retries = getattr(getattr(resp, "raw", None), "retries", None)
+    if retries is not None and retries.history:
+        inc("serpapi_retries_total", len(retries.history), endpoint=endpoint)
+    return resp
+
+
 def get_place_reviews(place_id: str) -> List[Dict[str, Any]]:
     """Trae reseñas de un lugar específico de Google Maps vía SerpApi."""
     if not _check_api_key():
@@ -46,7 +62,7 @@ def get_place_reviews(place_id: str) -> List[Dict[str, Any]]:
 
     session = _build_session()
     try:
-        resp = session.get("https://serpapi.com/search", params=params, timeout=10)
+        resp = _search(session, params, "google_maps_reviews")
         print(f"[SerpAPI] get_place_reviews status: {resp.status_code}")
         if resp.status_code != 200:
             print(f"[SerpAPI] get_place_reviews response: {resp.text}")
@@ -84,7 +100,7 @@ def get_reviews_google_maps(query: str, location: str, num: int ) -> List[Dict[s
 
     session = _build_session()
     try:
-        resp = session.get("https://serpapi.com/search", params=params, timeout=10)
+        resp = _search(session, params, "google_maps")
         print(f"[Debug] Status Code: {resp.status_code}")
         if resp.status_code != 200:
             print(f"[SerpAPI] Response: {resp.text}")
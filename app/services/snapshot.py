@@ -0,0 +1,465 @@
+"""Snapshots de solo lectura para servir búsquedas sin consultar la base.
+
+`export_snapshot` escribe un directorio autocontenido:
+
+    embeddings.npy       float32 (n, dim), normalizados (coseno = producto punto)
+    has_embedding.npy    bool (n,)
+    ids.npy              int64 (n,)
+    lat.npy, lon.npy     float64 (n,), NaN si falta
+    rating.npy           float32 (n,), NaN si falta
+    topic_id.npy         int32 (n,), -1 si no tiene tópico
+    place_id.npy, name.npy, text.npy, h3.npy
+                         int32 (n,), índices a la tabla de strings (-1 = None)
+    strings.bin          UTF-8 concatenado de todos los strings únicos
+    string_offsets.npy   int64 (n_strings + 1)
+    meta.json            versión, cantidad de filas, dimensión y tópicos
+    quantizer.npz, codes.npy
+                         opcionales (--quantize pq|int8): códigos compactos
+                         para el tier de baja memoria, ver quantization.py
+
+Todos los arrays se abren con mmap, así que varios workers de uvicorn
+comparten las mismas páginas vía el cache del sistema operativo y el arranque
+es casi instantáneo. Cada export se escribe en un directorio nuevo y después
+se apunta el symlink `current` al nuevo directorio con un rename atómico.
+
+El modo snapshot se activa con la variable de entorno SNAPSHOT_DIR (por
+ejemplo `data/snapshots/current`); las rutas /topic_model/search,
+/topic_model/similar, /topic_model/topics y /maps/ la usan en lugar de Postgres.
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models.review import Review
+from app.services.metrics import span, inc
+from app.services.topic_model import get_model, MAX_RESULTS, SIMILARITY_THRESHOLD, DEFAULT_N_SIMILAR
+from app.services.quantization import (
+    DEFAULT_SUBVECTORS, RERANK_SHORTLIST, TRAIN_SIZE, load_quantizer, make_quantizer, save_quantizer, shortlist_rerank,
+)
+
+DEFAULT_SNAPSHOT_ROOT = "data/snapshots"
+CURRENT_LINK = "current"
+EXPORT_CHUNK_SIZE = 10_000
+KEEP_SNAPSHOTS = 3
+
+STRING_COLUMNS = ("place_id", "name", "text", "h3")
+
+
+class _StringTable:
+    """Interna strings y los escribe como un blob UTF-8 + offsets."""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._values: List[str] = []
+
+    def add(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        idx = self._ids.get(value)
+        if idx is None:
+            idx = self._ids[value] = len(self._values)
+            self._values.append(value)
+        return idx
+
+    def write(self, directory: str) -> None:
+        offsets = np.zeros(len(self._values) + 1, dtype=np.int64)
+        with open(os.path.join(directory, "strings.bin"), "wb") as f:
+            pos = 0
+            for i, value in enumerate(self._values):
+                encoded = value.encode("utf-8")
+                f.write(encoded)
+                pos += len(encoded)
+                offsets[i + 1] = pos
+        np.save(os.path.join(directory, "string_offsets.npy"), offsets)
+
+
+def export_snapshot(db: Session, root: str = DEFAULT_SNAPSHOT_ROOT, keep: int = KEEP_SNAPSHOTS,
+                    quantize: Optional[str] = None, n_subvectors: int = DEFAULT_SUBVECTORS) -> str:
+    """Exporta la tabla de reseñas a un snapshot nuevo y lo publica como `current`.
+
+    Lee la base en tandas con `yield_per` para no materializar todos los
+    objetos ORM a la vez. Con `quantize` ("pq" o "int8") además entrena un
+    cuantizador sobre los embeddings y guarda los códigos. Devuelve la ruta
+    del snapshot creado.
+    """
+    n = db.query(Review).count()
+    dim_row = db.query(Review.embedding).filter(Review.embedding.isnot(None)).first()
+    dim = len(json.loads(dim_row[0])) if dim_row else 0
+    # Parámetros inválidos (p. ej. --subvectors que no divide la dimensión) fallan antes de exportar
+    quantizer = make_quantizer(quantize, n_subvectors=n_subvectors) if quantize else None
+    if quantizer is not None and dim:
+        quantizer.check_dim(dim)
+
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    final_dir = os.path.join(root, version)
+    tmp_dir = final_dir + ".tmp"
+    os.makedirs(tmp_dir)
+    print(f"[Snapshot] Exportando {n} reseñas (dim={dim}) a {final_dir}")
+    try:
+        _write_snapshot(db, tmp_dir, version, n, dim, quantizer)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    os.rename(tmp_dir, final_dir)
+    publish_snapshot(root, version)
+    _prune_snapshots(root, keep)
+    print(f"[Snapshot] OK: {final_dir}")
+    return final_dir
+
+
+def _write_snapshot(db: Session, tmp_dir: str, version: str, n: int, dim: int, quantizer=None) -> None:
+    """Escribe en `tmp_dir` todos los archivos del snapshot (ver docstring del módulo)."""
+    emb_path = os.path.join(tmp_dir, "embeddings.npy")
+    embeddings = np.lib.format.open_memmap(emb_path, mode="w+", dtype=np.float32, shape=(n, dim)) if n and dim else None
+    has_embedding = np.zeros(n, dtype=bool)
+    ids = np.zeros(n, dtype=np.int64)
+    lat = np.full(n, np.nan, dtype=np.float64)
+    lon = np.full(n, np.nan, dtype=np.float64)
+    rating = np.full(n, np.nan, dtype=np.float32)
+    topic_id = np.full(n, -1, dtype=np.int32)
+    string_cols = {c: np.full(n, -1, dtype=np.int32) for c in STRING_COLUMNS}
+    strings = _StringTable()
+    topics: Dict[str, int] = {}
+
+    query = db.query(
+        Review.id, Review.place_id, Review.name, Review.lat, Review.lon, Review.rating,
+        Review.text, Review.topic, Review.h3_index, Review.embedding,
+    ).order_by(Review.id).yield_per(EXPORT_CHUNK_SIZE)
+
+    count = 0
+    with span("snapshot.export"):
+        for i, row in enumerate(query):
+            if i >= n:
+                break
+            count = i + 1
+            ids[i] = row.id
+            if row.lat is not None:
+                lat[i] = row.lat
+            if row.lon is not None:
+                lon[i] = row.lon
+            if row.rating is not None:
+                rating[i] = row.rating
+            if row.topic:
+                topic_id[i] = topics.setdefault(row.topic, len(topics))
+            string_cols["place_id"][i] = strings.add(row.place_id)
+            string_cols["name"][i] = strings.add(row.name)
+            string_cols["text"][i] = strings.add(row.text)
+            string_cols["h3"][i] = strings.add(row.h3_index)
+            if row.embedding and embeddings is not None:
+                vec = np.asarray(json.loads(row.embedding), dtype=np.float32)
+                norm = np.linalg.norm(vec)
+                embeddings[i] = vec / norm if norm > 0 else vec
+                has_embedding[i] = True
+            if (i + 1) % EXPORT_CHUNK_SIZE == 0:
+                print(f"[Snapshot] {i + 1}/{n} filas exportadas")
+
+    if count < n:
+        # Se borraron filas entre el count() y la lectura: las posiciones sin
+        # llenar quedarían con id 0 al final y `ids` dejaría de estar ordenado
+        print(f"[Snapshot] Se leyeron {count} de {n} filas, se recortan las columnas")
+        has_embedding, ids, lat, lon = has_embedding[:count], ids[:count], lat[:count], lon[:count]
+        rating, topic_id = rating[:count], topic_id[:count]
+        string_cols = {c: arr[:count] for c, arr in string_cols.items()}
+        if embeddings is not None:
+            embeddings = _truncate_embeddings(emb_path, embeddings, count)
+        n = count
+
+    if embeddings is not None:
+        embeddings.flush()
+        if quantizer is not None and has_embedding.any():
+            print(f"[Snapshot] Entrenando cuantizador {quantizer.kind}")
+            train_rows = np.flatnonzero(has_embedding)
+            if len(train_rows) > TRAIN_SIZE:
+                train_rows = np.sort(np.random.default_rng(42).choice(train_rows, TRAIN_SIZE, replace=False))
+            quantizer.fit(embeddings[train_rows])
+            save_quantizer(tmp_dir, quantizer, quantizer.encode(embeddings))
+        del embeddings
+    for name, arr in [("has_embedding", has_embedding), ("ids", ids), ("lat", lat), ("lon", lon),
+                      ("rating", rating), ("topic_id", topic_id)] + list(string_cols.items()):
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), arr)
+    strings.write(tmp_dir)
+
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": version,
+            "n_reviews": n,
+            "dim": dim,
+            "topics": sorted(topics, key=topics.get),
+        }, f, ensure_ascii=False, indent=2)
+
+
+def _truncate_embeddings(path: str, embeddings: np.memmap, count: int) -> Optional[np.memmap]:
+    """Reescribe `path` con las primeras `count` filas y lo reabre (None si no queda ninguna)."""
+    embeddings.flush()
+    if count == 0:
+        del embeddings
+        os.remove(path)
+        return None
+    trimmed_path = path + ".trim"
+    with open(trimmed_path, "wb") as f:
+        np.save(f, embeddings[:count])
+    del embeddings
+    os.replace(trimmed_path, path)
+    return np.load(path, mmap_mode="r")
+
+
+def publish_snapshot(root: str, version: str) -> None:
+    """Apunta `root/current` a `version` de forma atómica (symlink + rename)."""
+    link = os.path.join(root, CURRENT_LINK)
+    tmp_link = f"{link}.{os.getpid()}.tmp"
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(version, tmp_link)
+    os.replace(tmp_link, link)
+
+
+def _prune_snapshots(root: str, keep: int) -> None:
+    """Borra snapshots viejos dejando los `keep` más recientes (nunca el actual)."""
+    current = os.path.realpath(os.path.join(root, CURRENT_LINK))
+    versions = sorted(
+        d for d in os.listdir(root)
+        if not d.endswith(".tmp") and d != CURRENT_LINK and os.path.isdir(os.path.join(root, d))
+    )
+    for version in versions[:-keep] if keep > 0 else []:
+        path = os.path.join(root, version)
+        if os.path.realpath(path) != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class Snapshot:
+    """Vista de solo lectura sobre un snapshot mapeado en memoria."""
+
+    def __init__(self, directory: str):
+        self.directory = os.path.realpath(directory)
+        with open(os.path.join(self.directory, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.version = self.meta["version"]
+        self.topics: List[str] = self.meta["topics"]
+
+        def load(name):
+            return np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+
+        emb_path = os.path.join(self.directory, "embeddings.npy")
+        self.embeddings = np.load(emb_path, mmap_mode="r") if os.path.exists(emb_path) else None
+        self.has_embedding = load("has_embedding")
+        self.ids = load("ids")
+        self.lat = load("lat")
+        self.lon = load("lon")
+        self.rating = load("rating")
+        self.topic_id = load("topic_id")
+        self.place_id = load("place_id")
+        self.name = load("name")
+        self.text = load("text")
+        self.h3 = load("h3")
+        self._offsets = load("string_offsets")
+        self.quantizer, self.codes = load_quantizer(self.directory)
+        strings_path = os.path.join(self.directory, "strings.bin")
+        self._strings = np.memmap(strings_path, dtype=np.uint8, mode="r") if os.path.getsize(strings_path) else np.zeros(0, dtype=np.uint8)
+        self._names_lower: Optional[Tuple[np.ndarray, List[str]]] = None
+        self._cell_rows: Optional[Dict[str, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def string(self, idx: int) -> Optional[str]:
+        if idx < 0:
+            return None
+        start, end = self._offsets[idx], self._offsets[idx + 1]
+        return self._strings[start:end].tobytes().decode("utf-8")
+
+    def row_for_id(self, review_id: int) -> Optional[int]:
+        """Fila de la reseña; `ids` está ordenado (export con order_by(Review.id))."""
+        row = int(np.searchsorted(self.ids, review_id))
+        if row < len(self.ids) and int(self.ids[row]) == review_id:
+            return row
+        return None
+
+    def _float(self, arr, row: int) -> Optional[float]:
+        value = float(arr[row])
+        return None if np.isnan(value) else value
+
+    def topic(self, row: int) -> Optional[str]:
+        tid = int(self.topic_id[row])
+        return self.topics[tid] if tid >= 0 else None
+
+    def place_dict(self, row: int) -> Dict[str, Any]:
+        """Misma forma que devuelven find_similar_to_query y /similar."""
+        return {
+            "place_id": self.string(int(self.place_id[row])),
+            "name": self.string(int(self.name[row])),
+            "lat": self._float(self.lat, row),
+            "lon": self._float(self.lon, row),
+            "rating": self._float(self.rating, row),
+            "text": self.string(int(self.text[row])),
+            "topic": self.topic(row),
+        }
+
+    def _neighborhood_mask(self, neighborhood: str) -> np.ndarray:
+        """Equivalente a `Review.name.ilike('%barrio%')` sobre la tabla de strings."""
+        if self._names_lower is None:
+            name_ids = np.unique(self.name[self.name >= 0])
+            self._names_lower = (name_ids, [(self.string(int(i)) or "").lower() for i in name_ids])
+        needle = neighborhood.lower()
+        name_ids, names = self._names_lower
+        matching = [i for i, name in zip(name_ids, names) if needle in name]
+        return np.isin(self.name, matching)
+
+    def rows_in_cells(self, cells: List[str]) -> np.ndarray:
+        """Filas cuyas celdas H3 están en `cells` (índice celda -> filas armado la primera vez)."""
+        if self._cell_rows is None:
+            order = np.argsort(self.h3, kind="stable")
+            order = order[np.asarray(self.h3)[order] >= 0]
+            cell_ids, starts = np.unique(np.asarray(self.h3)[order], return_index=True)
+            bounds = list(starts[1:]) + [len(order)]
+            self._cell_rows = {self.string(int(c)): order[s:e] for c, s, e in zip(cell_ids, starts, bounds)}
+        found = [self._cell_rows[c] for c in cells if c in self._cell_rows]
+        return np.sort(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+    def search(self, query_embedding: Optional[np.ndarray], neighborhood: Optional[str] = None,
+               min_rating: float = 0.0, n_similar: int = MAX_RESULTS, threshold: float = SIMILARITY_THRESHOLD) -> List[Dict]:
+        """Versión vectorizada de `find_similar_to_query` sobre el snapshot."""
+        mask = np.asarray(self.has_embedding).copy()
+        if neighborhood and neighborhood != "Todos":
+            mask &= self._neighborhood_mask(neighborhood)
+        rating = np.nan_to_num(np.asarray(self.rating, dtype=np.float32), nan=0.0)
+        if min_rating > 0:
+            mask &= rating >= min_rating
+        rows = np.flatnonzero(mask)
+        inc("rows_scanned_total", len(rows), op="snapshot_search")
+        if len(rows) == 0:
+            return []
+
+        if query_embedding is None:
+            order = rows[np.argsort(-rating[rows], kind="stable")[:n_similar]]
+            return [dict(self.place_dict(int(r)), similarity_score=1.0) for r in order]
+
+        with span("snapshot.scoring"):
+            q = np.asarray(query_embedding, dtype=np.float32)
+            norm = np.linalg.norm(q)
+            q = q / norm if norm > 0 else q
+            inc("vectors_scored_total", len(rows), op="snapshot_search")
+            rows, sims = self._score(rows, q, max(RERANK_SHORTLIST, 10 * n_similar))
+            keep = sims > threshold
+            rows, sims = rows[keep], sims[keep]
+            scores = 0.7 * sims + 0.3 * (rating[rows] / 5.0)
+            top = np.argsort(-scores, kind="stable")[:n_similar]
+
+        results = []
+        for i in top:
+            row = int(rows[i])
+            item = self.place_dict(row)
+            item["rating"] = float(rating[row])
+            item["similarity_score"] = float(sims[i])
+            item["score"] = float(scores[i])
+            results.append(item)
+        return results
+
+    def similar(self, review_id: int, n: int = DEFAULT_N_SIMILAR, threshold: float = SIMILARITY_THRESHOLD) -> List[Dict]:
+        """Versión vectorizada de `get_similar_reviews`, ya serializada como en /similar."""
+        source = self.row_for_id(review_id)
+        if source is None or not self.has_embedding[source]:
+            return []
+        with span("snapshot.scoring"):
+            valid = np.asarray(self.has_embedding).copy()
+            valid[source] = False
+            rows = np.flatnonzero(valid)
+            inc("vectors_scored_total", len(rows), op="snapshot_similar")
+            rows, sims = self._score(rows, np.asarray(self.embeddings[source]), max(RERANK_SHORTLIST, 10 * n))
+            keep = sims > threshold
+            rows, sims = rows[keep], sims[keep]
+            top = np.argsort(-sims, kind="stable")[:n]
+        return [dict(self.place_dict(int(rows[i])), similarity_score=float(sims[i])) for i in top]
+
+    def _score(self, rows: np.ndarray, query: np.ndarray, shortlist: int):
+        """Similitud coseno de `query` contra `rows`.
+
+        Sin cuantizador compara contra todos los vectores exactos; con
+        cuantizador puntúa los códigos y re-rankea solo los `shortlist` mejores.
+        """
+        if self.quantizer is None:
+            return rows, self.embeddings[rows] @ query
+        return shortlist_rerank(self.quantizer, self.codes, self.embeddings, rows, query, shortlist)
+
+    def map_data(self, topic_filter: Optional[str] = None) -> Dict[str, List[Dict]]:
+        """Mismo formato que GET /maps/: reseñas agrupadas por celda H3."""
+        mask = self.h3 >= 0
+        if topic_filter:
+            if topic_filter not in self.topics:
+                return {}
+            mask &= self.topic_id == self.topics.index(topic_filter)
+        map_data = defaultdict(list)
+        for row in np.flatnonzero(mask):
+            row = int(row)
+            map_data[self.string(int(self.h3[row]))].append({
+                "name": self.string(int(self.name[row])),
+                "text": self.string(int(self.text[row])),
+                "rating": self._float(self.rating, row),
+                "topic": self.topic(row),
+                "lat": self._float(self.lat, row),
+                "lon": self._float(self.lon, row),
+            })
+        return dict(map_data)
+
+
+_snapshot: Optional[Snapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> Optional[Snapshot]:
+    """Devuelve el snapshot activo, o None si no está activado el modo snapshot.
+
+    Si SNAPSHOT_DIR es un symlink (p. ej. `current`) y cambió de destino desde
+    la última carga, reabre el snapshot nuevo. Así un export publicado con
+    `publish_snapshot` se toma sin reiniciar los workers.
+    """
+    global _snapshot
+    directory = os.getenv("SNAPSHOT_DIR")
+    if not directory:
+        return None
+    target = os.path.realpath(directory)
+    if _snapshot is None or _snapshot.directory != target:
+        with _snapshot_lock:
+            if _snapshot is None or _snapshot.directory != target:
+                with span("snapshot.load"):
+                    _snapshot = Snapshot(target)
+                print(f"[Snapshot] Cargado snapshot {_snapshot.version} ({len(_snapshot)} reseñas)")
+    return _snapshot
+
+
+def find_similar_to_query_snapshot(snapshot: Snapshot, query: str, neighborhood: Optional[str] = None,
+                                   min_rating: float = 0.0, n_similar: int = MAX_RESULTS) -> List[Dict]:
+    """Igual que `find_similar_to_query` pero leyendo del snapshot en lugar de la base."""
+    print(f"[Search] (snapshot {snapshot.version}) Query: '{query}', min_rating: {min_rating}")
+    query_embedding = None
+    if query and query.strip():
+        with span("search.encode_query"):
+            query_embedding = get_model().encode(query.strip())
+    return snapshot.search(query_embedding, neighborhood=neighborhood, min_rating=min_rating,
+                           n_similar=n_similar, threshold=SIMILARITY_THRESHOLD)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta un snapshot de solo lectura de las reseñas")
+    parser.add_argument("--root", default=DEFAULT_SNAPSHOT_ROOT)
+    parser.add_argument("--keep", type=int, default=KEEP_SNAPSHOTS, help="Snapshots viejos a conservar")
+    parser.add_argument("--quantize", choices=["pq", "int8"], default=None,
+                        help="Guardar códigos compactos para búsqueda con poca memoria")
+    parser.add_argument("--subvectors", type=int, default=DEFAULT_SUBVECTORS, help="Subvectores para PQ")
+    args = parser.parse_args()
+
+    from app.db.database import get_db
+    db = next(get_db())
+    export_snapshot(db, root=args.root, keep=args.keep, quantize=args.quantize, n_subvectors=args.subvectors)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,15 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Optional, Tuple
 import json
+import os
+import tempfile
 from sqlalchemy.orm import Session
 from app.models.review import Review
-from sentence_transformers import SentenceTransformer
 from sklearn.cluster import KMeans
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 import h3
 from app.services.text_processing import preprocess_review
+from app.services.metrics import span, inc, observe, SpanTotal, SIZE_BUCKETS
 
 MODEL_NAME = "paraphrase-MiniLM-L3-v2"
 BATCH_SIZE = 8
@@ -16,68 +18,120 @@ MAX_RESULTS = 20
 N_TOPICS = 15
 MIN_CLUSTER_SIZE = 3
 DEFAULT_N_SIMILAR = 10
+H3_RESOLUTION = 7
+TOPIC_CENTROIDS_PATH = "data/topic_centroids.npz"
+
+# Progreso de tareas largas: callback(procesadas, total)
+ProgressCallback = Callable[[int, int], None]
 
 _model = None
 
-def get_model() -> SentenceTransformer:
-    """Devuelve el modelo SentenceTransformer como singleton.
+def load_local_model():
+    """Carga el SentenceTransformer en este proceso.
 
     Usa la CPU y desactiva el paralelismo del tokenizer para no tener picos de memoria.
+    El import de sentence_transformers es perezoso para no cargar torch si no hace falta.
+    """
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MODEL_NAME, device='cpu')
+
+
+def get_model():
+    """Devuelve el encoder como singleton.
+
+    Si ENCODER_SOCKET está definido, usa el servidor de inferencia compartido
+    (ver app/services/inference_server.py). Con ENCODER_FALLBACK=1, si el
+    servidor no está levantado carga el modelo en este proceso hasta que vuelva;
+    sin esa variable, los encode fallan mientras el servidor no esté.
     """
     global _model
     if _model is None:
-        import os
-        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
-        _model = SentenceTransformer(MODEL_NAME, device='cpu')
+        socket_path = os.getenv("ENCODER_SOCKET")
+        if socket_path:
+            from app.services.inference_server import RemoteEncoder
+            fallback = os.getenv("ENCODER_FALLBACK", "").strip().lower() in ("1", "true", "yes", "on")
+            _model = RemoteEncoder(socket_path, fallback=load_local_model if fallback else None)
+        else:
+            _model = load_local_model()
     return _model
 
 
+def set_model(model) -> None:
+    """Reemplaza el modelo singleton (p. ej. por un encoder stub en benchmarks).
+
+    Cualquier objeto con un método `encode(texts, **kwargs)` compatible con
+    SentenceTransformer sirve. Pasar None vuelve a cargar el modelo real.
+    """
+    global _model
+    _model = model
+
+
 def process_in_batches(items: List[Any], batch_size: int = BATCH_SIZE):
     """Divide una lista en batches para procesar sin comerse toda la RAM."""
     for i in range(0, len(items), batch_size):
         yield items[i:i + batch_size]
 
 
-def precompute_embeddings(db: Session) -> bool:
+def precompute_embeddings(db: Session, progress: Optional[ProgressCallback] = None) -> bool:
     """Calcula y guarda embeddings para reseñas que todavía no los tienen.
 
     Lee las reseñas sin embedding, las procesa en batches, calcula los vectores
     con SentenceTransformer y los guarda como JSON en la base de datos.
     """
-    model = get_model()
-    reviews = db.query(Review).filter(Review.text.isnot(None), Review.embedding.is_(None)).all()
+    with span("embeddings.db_fetch"):
+        reviews = db.query(Review).filter(Review.text.isnot(None), Review.embedding.is_(None)).all()
+    inc("rows_scanned_total", len(reviews), op="embeddings")
+    embed_reviews(db, reviews, progress=progress)
+    print("[Embeddings] OK")
+    return True
+
+
+def embed_reviews(db: Session, reviews: List[Review], progress: Optional[ProgressCallback] = None) -> int:
+    """Calcula embeddings solo para `reviews`, en batches, commiteando cada batch.
 
+    Devuelve cuántas reseñas quedaron con embedding (sin contar las que fallaron).
+    """
+    model = get_model()
     print(f"[Embeddings] {len(reviews)} reseñas a procesar (batch={BATCH_SIZE})")
     processed = 0
+    written = 0
 
     for batch in process_in_batches(reviews, BATCH_SIZE):
         texts = [f"{r.name or ''} {r.text or ''}".strip() for r in batch]
+        observe("encode_batch_size", len(texts), buckets=SIZE_BUCKETS, op="embeddings")
         try:
-            embeddings = model.encode(
-                texts,
-                batch_size=BATCH_SIZE,
-                show_progress_bar=False,
-                convert_to_numpy=True,
-                device='cpu'
-            )
+            with span("embeddings.encode"):
+                embeddings = model.encode(
+                    texts,
+                    batch_size=BATCH_SIZE,
+                    show_progress_bar=False,
+                    convert_to_numpy=True,
+                    device='cpu'
+                )
             for review, embedding in zip(batch, embeddings):
                 review.embedding = json.dumps(embedding.tolist())
+            written += len(batch)
         except Exception as e:
             print(f"[Embeddings] Error encode batch: {e}. Intento uno a uno...")
             for review, txt in zip(batch, texts):
                 try:
                     emb = model.encode(txt, show_progress_bar=False, convert_to_numpy=True, device='cpu')
                     review.embedding = json.dumps(emb.tolist())
+                    written += 1
                 except Exception as e2:
                     print(f"[Embeddings] Error en reseña {getattr(review,'id',None)}: {e2}")
                     continue
 
-        db.commit()
+        with span("embeddings.db_commit"):
+            db.commit()
         processed += len(batch)
         print(f"[Embeddings] {processed}/{len(reviews)} procesadas")
-
-    print("[Embeddings] OK")
-    return True
+        if progress is not None:
+            progress(processed, len(reviews))
+    if written < processed:
+        print(f"[Embeddings] {processed - written} reseñas quedaron sin embedding")
+    return written
 
 
 def find_similar_to_query(db: Session, query: str, neighborhood: Optional[str] = None, min_rating: float = 0.0, n_similar: int = MAX_RESULTS) -> List[Dict]:
@@ -97,7 +151,9 @@ def find_similar_to_query(db: Session, query: str, neighborhood: Optional[str] =
     if min_rating > 0:
         query_obj = query_obj.filter(Review.rating >= min_rating)
 
-    reviews = query_obj.all()
+    with span("search.db_fetch"):
+        reviews = query_obj.all()
+    inc("rows_scanned_total", len(reviews), op="search")
     print(f"[Search] {len(reviews)} reseñas para comparar")
     if not reviews:
         return []
@@ -115,32 +171,45 @@ def find_similar_to_query(db: Session, query: str, neighborhood: Optional[str] =
         } for r in reviews[:n_similar]]
 
     model = get_model()
-    query_embedding = model.encode(f"{query}".strip())
+    observe("encode_batch_size", 1, buckets=SIZE_BUCKETS, op="search")
+    with span("search.encode_query"):
+        query_embedding = model.encode(f"{query}".strip())
     print("[Search] Embedding de la consulta listo")
 
+    decode = SpanTotal("search.decode_embeddings")
+    scoring = SpanTotal("search.scoring")
+    rank = SpanTotal("search.rank")
     results = []
     for batch in process_in_batches(reviews):
-        batch_embeddings = np.array([np.array(json.loads(r.embedding)) for r in batch])
-        similarities = cosine_similarity([query_embedding], batch_embeddings)[0]
-
-        for review, similarity in zip(batch, similarities):
-            if similarity > SIMILARITY_THRESHOLD:
-                rating = float(review.rating) if review.rating else 0.0
-                rating_norm = rating / 5.0
-                combined_score = 0.7 * float(similarity) + 0.3 * rating_norm
-                results.append({
-                    "place_id": review.place_id,
-                    "name": review.name,
-                    "lat": float(review.lat) if review.lat else None,
-                    "lon": float(review.lon) if review.lon else None,
-                    "rating": rating,
-                    "text": review.text,
-                    "topic": review.topic,
-                    "similarity_score": float(similarity),
-                    "score": float(combined_score)
-                })
-
-    results.sort(key=lambda x: x.get("score", x.get("similarity_score", 0.0)), reverse=True)
+        with decode:
+            batch_embeddings = np.array([np.array(json.loads(r.embedding)) for r in batch])
+        with scoring:
+            similarities = cosine_similarity([query_embedding], batch_embeddings)[0]
+
+        with rank:
+            for review, similarity in zip(batch, similarities):
+                if similarity > SIMILARITY_THRESHOLD:
+                    rating = float(review.rating) if review.rating else 0.0
+                    rating_norm = rating / 5.0
+                    combined_score = 0.7 * float(similarity) + 0.3 * rating_norm
+                    results.append({
+                        "place_id": review.place_id,
+                        "name": review.name,
+                        "lat": float(review.lat) if review.lat else None,
+                        "lon": float(review.lon) if review.lon else None,
+                        "rating": rating,
+                        "text": review.text,
+                        "topic": review.topic,
+                        "similarity_score": float(similarity),
+                        "score": float(combined_score)
+                    })
+    inc("vectors_scored_total", len(reviews), op="search")
+
+    with rank:
+        results.sort(key=lambda x: x.get("score", x.get("similarity_score", 0.0)), reverse=True)
+    decode.record()
+    scoring.record()
+    rank.record()
     return results[:n_similar]
 
 
@@ -150,35 +219,49 @@ def get_similar_reviews(db: Session, review_id: int, n: int = DEFAULT_N_SIMILAR)
     Calcula similitud coseno entre el embedding de la reseña fuente y el resto,
     y devuelve una lista con las N más parecidas.
     """
-    source = db.query(Review).filter(Review.id == review_id).first()
-    if not source or not source.embedding:
-        return []
+    with span("similar.db_fetch"):
+        source = db.query(Review).filter(Review.id == review_id).first()
+        if not source or not source.embedding:
+            return []
 
-    reviews = db.query(Review).filter(Review.embedding.isnot(None), Review.id != review_id).all()
+        reviews = db.query(Review).filter(Review.embedding.isnot(None), Review.id != review_id).all()
+    inc("rows_scanned_total", len(reviews), op="similar")
     if not reviews:
         return []
 
     source_embedding = np.array(json.loads(source.embedding))
+    decode = SpanTotal("similar.decode_embeddings")
+    scoring = SpanTotal("similar.scoring")
+    rank = SpanTotal("similar.rank")
     results = []
-
     for batch in process_in_batches(reviews):
-        batch_embeddings = np.array([np.array(json.loads(r.embedding)) for r in batch])
-        similarities = cosine_similarity([source_embedding], batch_embeddings)[0]
-
-        for review, sim in zip(batch, similarities):
-            if sim > SIMILARITY_THRESHOLD:
-                results.append({"review": review, "similarity": float(sim)})
-
-    results.sort(key=lambda x: x["similarity"], reverse=True)
+        with decode:
+            batch_embeddings = np.array([np.array(json.loads(r.embedding)) for r in batch])
+        with scoring:
+            similarities = cosine_similarity([source_embedding], batch_embeddings)[0]
+
+        with rank:
+            for review, sim in zip(batch, similarities):
+                if sim > SIMILARITY_THRESHOLD:
+                    results.append({"review": review, "similarity": float(sim)})
+    inc("vectors_scored_total", len(reviews), op="similar")
+
+    with rank:
+        results.sort(key=lambda x: x["similarity"], reverse=True)
+    decode.record()
+    scoring.record()
+    rank.record()
     return [(r["review"], r["similarity"]) for r in results[:n]]
 
 
-def run_topic_modeling(db: Session, n_topics: int = N_TOPICS) -> bool:
+def run_topic_modeling(db: Session, n_topics: int = N_TOPICS, progress: Optional[ProgressCallback] = None,
+                       centroids_path: str = TOPIC_CENTROIDS_PATH) -> bool:
     """Agrupa reseñas en tópicos usando KMeans sobre los embeddings.
 
     Ajusta el número de tópicos si hay pocos datos, calcula labels con KMeans,
     extrae palabras representativas por cluster y actualiza cada reseña con su
-    tópico y su índice H3 si tiene coordenadas.
+    tópico y su índice H3 si tiene coordenadas. Guarda los centroides para
+    poder asignar tópico a reseñas nuevas sin volver a ajustar (ver `assign_topics`).
     """
     print(f"[TopicModeling] Inicio con {n_topics} tópicos...")
 
@@ -187,7 +270,9 @@ def run_topic_modeling(db: Session, n_topics: int = N_TOPICS) -> bool:
         print(f"[TopicModeling] {missing_count} reseñas sin embedding. Calculando...")
         precompute_embeddings(db)
 
-    reviews = db.query(Review).filter(Review.embedding.isnot(None)).all()
+    with span("topics.db_fetch"):
+        reviews = db.query(Review).filter(Review.embedding.isnot(None)).all()
+    inc("rows_scanned_total", len(reviews), op="topics")
     if not reviews:
         print("[TopicModeling] No hay reseñas para procesar")
         return False
@@ -197,10 +282,12 @@ def run_topic_modeling(db: Session, n_topics: int = N_TOPICS) -> bool:
         print(f"[TopicModeling] Ajustando tópicos a {adjusted_topics}")
         n_topics = adjusted_topics
 
-    embeddings = np.array([np.array(json.loads(r.embedding)) for r in reviews])
+    with span("topics.decode_embeddings"):
+        embeddings = np.array([np.array(json.loads(r.embedding)) for r in reviews])
 
-    kmeans = KMeans(n_clusters=n_topics, random_state=42, n_init=10, max_iter=300)
-    labels = kmeans.fit_predict(embeddings)
+    with span("topics.kmeans"):
+        kmeans = KMeans(n_clusters=n_topics, random_state=42, n_init=10, max_iter=300)
+        labels = kmeans.fit_predict(embeddings)
 
     cluster_texts = [[] for _ in range(n_topics)]
     cluster_sizes = [0] * n_topics
@@ -212,39 +299,106 @@ def run_topic_modeling(db: Session, n_topics: int = N_TOPICS) -> bool:
     for i, size in enumerate(cluster_sizes):
         print(f"Cluster {i}: {size} reseñas")
 
-    processed = 0
-    for batch_start in range(0, len(reviews), BATCH_SIZE):
-        batch_end = min(batch_start + BATCH_SIZE, len(reviews))
-        batch = reviews[batch_start:batch_end]
-        batch_labels = labels[batch_start:batch_end]
-
-        for review, label in zip(batch, batch_labels):
-            texts_in_cluster = ' '.join(cluster_texts[label])
-            words = texts_in_cluster.split()
-
-            word_freq = {}
-            for word in set(words):
-                tf = words.count(word)
-                other_clusters_with_word = sum(1 for i in range(n_topics) if i != label and word in ' '.join(cluster_texts[i]))
-                significance = tf * (1.0 / (1.0 + other_clusters_with_word))
-                word_freq[word] = significance
+    # El nombre depende solo del cluster: se calcula una vez por tópico
+    joined_texts = [' '.join(texts) for texts in cluster_texts]
+    topic_names = []
+    for label in range(n_topics):
+        words = joined_texts[label].split()
 
-            significant_words = sorted(word_freq.items(), key=lambda x: -x[1])[:4]
-            selected_words = [w for w, _ in significant_words]
+        word_freq = {}
+        for word in set(words):
+            tf = words.count(word)
+            other_clusters_with_word = sum(1 for i in range(n_topics) if i != label and word in joined_texts[i])
+            significance = tf * (1.0 / (1.0 + other_clusters_with_word))
+            word_freq[word] = significance
 
-            review.topic = f"Topic {label}: {', '.join(selected_words)}"
-
-            if review.lat is not None and review.lon is not None:
-                try:
-                    review.h3_index = h3.geo_to_h3(float(review.lat), float(review.lon), 7)
-                except Exception as e:
-                    print(f"Error H3 reseña {getattr(review,'id',None)}: {e}")
-                    review.h3_index = None
-
-            processed += 1
-
-        db.commit()
-        print(f"[TopicModeling] {processed}/{len(reviews)} procesadas")
+        significant_words = sorted(word_freq.items(), key=lambda x: -x[1])[:4]
+        selected_words = [w for w, _ in significant_words]
+        topic_names.append(f"Topic {label}: {', '.join(selected_words)}")
 
+    processed = 0
+    with span("topics.assign"):
+        for batch_start in range(0, len(reviews), BATCH_SIZE):
+            batch_end = min(batch_start + BATCH_SIZE, len(reviews))
+            batch = reviews[batch_start:batch_end]
+            batch_labels = labels[batch_start:batch_end]
+
+            for review, label in zip(batch, batch_labels):
+                review.topic = topic_names[label]
+                assign_h3(review)
+                processed += 1
+
+            db.commit()
+            print(f"[TopicModeling] {processed}/{len(reviews)} procesadas")
+            if progress is not None:
+                progress(processed, len(reviews))
+
+    save_topic_centroids(kmeans.cluster_centers_, topic_names, centroids_path)
     print("[TopicModeling] OK")
     return True
+
+
+def assign_h3(review: Review) -> None:
+    """Calcula la celda H3 de la reseña si tiene coordenadas."""
+    if review.lat is not None and review.lon is not None:
+        try:
+            review.h3_index = h3.geo_to_h3(float(review.lat), float(review.lon), H3_RESOLUTION)
+        except Exception as e:
+            print(f"Error H3 reseña {getattr(review,'id',None)}: {e}")
+            review.h3_index = None
+
+
+_centroids_cache: Dict[str, Tuple[float, np.ndarray, List[str]]] = {}
+
+
+def save_topic_centroids(centers: np.ndarray, topic_names: List[str], path: str = TOPIC_CENTROIDS_PATH) -> None:
+    """Guarda centroides y nombres de tópico del último ajuste (escritura atómica)."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # Temporal único por llamada (puede haber varios jobs/threads en el mismo proceso)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp.npz")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, centers=np.asarray(centers, dtype=np.float32), names=np.array(topic_names))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_topic_centroids(path: str = TOPIC_CENTROIDS_PATH) -> Optional[Tuple[np.ndarray, List[str]]]:
+    """Centroides del último run_topic_modeling, o None si todavía no se corrió."""
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    cached = _centroids_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with np.load(path) as data:
+            cached = (mtime, data["centers"], [str(n) for n in data["names"]])
+        _centroids_cache[path] = cached
+    return cached[1], cached[2]
+
+
+def assign_topics(reviews: List[Review], centroids_path: str = TOPIC_CENTROIDS_PATH) -> int:
+    """Asigna a cada reseña (con embedding) el tópico del centroide más cercano.
+
+    Es lo que haría `kmeans.predict` con el último ajuste, sin recalcular
+    KMeans sobre toda la tabla. Devuelve cuántas reseñas se asignaron.
+    """
+    loaded = load_topic_centroids(centroids_path)
+    if loaded is None:
+        print("[TopicModeling] Sin centroides guardados, correr run_topic_modeling primero")
+        return 0
+    centers, names = loaded
+    reviews = [r for r in reviews if r.embedding]
+    if not reviews:
+        return 0
+    with span("topics.nearest_centroid"):
+        embeddings = np.array([json.loads(r.embedding) for r in reviews], dtype=np.float32)
+        # ||e - c||² sin el término ||e||², que no cambia el argmin
+        distances = (centers ** 2).sum(axis=1)[None, :] - 2.0 * embeddings @ centers.T
+        labels = distances.argmin(axis=1)
+    for review, label in zip(reviews, labels):
+        review.topic = names[label]
+    return len(reviews)